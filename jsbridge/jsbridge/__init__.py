@@ -7,6 +7,7 @@ import os
 from .errors import *
 from .jsbridge import find_port, wait_and_create_network
 from .jsobjects import JSObject
+from .network import Listener
 
 
 parent = os.path.abspath(os.path.dirname(__file__))
@@ -16,6 +16,7 @@ Cu.import("resource://jsbridge/modules/Log.jsm");
 
 // Constants for preferences names
 const PREF_JSBRIDGE_PORT = "extensions.jsbridge.port";
+const PREF_JSBRIDGE_REVERSE = "extensions.jsbridge.reverse";
 
 
 /**
@@ -56,10 +57,20 @@ JSBridge.prototype = {
         // The port the server has to be started on is set via a preference
         let port = Services.prefs.getIntPref(PREF_JSBRIDGE_PORT);
 
+        // In reverse mode the harness is already listening on the port
+        let reverse = Services.prefs.prefHasUserValue(PREF_JSBRIDGE_REVERSE) &&
+                      Services.prefs.getBoolPref(PREF_JSBRIDGE_REVERSE);
+
         var self = this;
         var startCallback = {
           notify: function sc_notify(timer) {
             try {
+              if (reverse) {
+                // Connect the sessions to the harness right away
+                self.server.connect();
+                return;
+              }
+
               // Try to start the JSBridge server via a socket. If we fail we
               // will try as long as we do not run into a JSBridgeTimeout and
               // Mozmill kills the application.
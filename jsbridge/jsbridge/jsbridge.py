@@ -2,14 +2,13 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, you can obtain one at http://mozilla.org/MPL/2.0/.
 
-import asyncore
 from datetime import datetime, timedelta
 import socket
 from time import sleep
 
 from .errors import ConnectionError
 from .jsobjects import JSObject
-from .network import Bridge, BackChannel, create_network
+from .network import Bridge, BackChannel, EventLoop, Listener, create_network
 
 
 def find_port():
@@ -21,31 +20,19 @@ def find_port():
     return port
 
 
-def wait_and_create_network(host, port, timeout=60):
+def wait_and_create_network(host, port, timeout=60, loop=None,
+                            listener=None):
+    # an extension in reverse mode connects to the listener by itself
+    if listener is not None:
+        return listener.create_network(timeout, loop)
+
     deadline = datetime.utcnow() + timedelta(seconds=timeout)
-    connected = False
 
     while datetime.utcnow() < deadline:
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((host, port))
-            s.close()
-            connected = True
-            break
+            return create_network(host, port, loop)
         except socket.error:
             pass
         sleep(.25)
-    if not connected:
-        raise ConnectionError("Failed to connect to extension, port: %s" % port)
-
-    back_channel, bridge = create_network(host, port)
-    sleep(.5)
-
-    while back_channel.registered is False:
-        back_channel.close()
-        bridge.close()
-        asyncore.socket_map = {}
-        sleep(1)
-        back_channel, bridge = create_network(host, port)
 
-    return back_channel, bridge
+    raise ConnectionError("Failed to connect to extension, port: %s" % port)
@@ -23,7 +23,7 @@ def init_jsobject(cls, bridge, name, value, description=None):
 
 
 def create_jsobject(bridge, fullname, value=None, obj_type=None,
-                    override_set=False):
+                    override_set=False, cache=False):
     """Create a single JSObject for named object on other side of the bridge.
 
     This is a factory method which assists in creating a JS object by handling
@@ -37,6 +37,7 @@ def create_jsobject(bridge, fullname, value=None, obj_type=None,
     value -- Value of the object wrapped as JS object
     obj_type -- Type of the JS object to create from
     override_set -- Override the name of the object
+    cache -- Cache the description and the attributes of the object
 
     """
     description = bridge.describe(fullname)
@@ -55,7 +56,7 @@ def create_jsobject(bridge, fullname, value=None, obj_type=None,
                                 description=description)
         else:
             obj = cls(bridge, fullname, description=description,
-                      override_set=override_set)
+                      override_set=override_set, cache=cache)
         return obj
     else:
         # Something very bad happened, we don't have a representation
@@ -64,24 +65,57 @@ def create_jsobject(bridge, fullname, value=None, obj_type=None,
 
 
 class JSObject(object):
-    """Base javascript object representation."""
+    """Base javascript object representation.
+
+    With cache set to True the description of the object and its already
+    retrieved attributes are kept until the next operation on the bridge
+    which could modify javascript objects (see Bridge.generation).
+
+    """
     _loaded_ = False
+    _cache_ = False
+    _description_ = None
+    _generation_ = None
 
-    def __init__(self, bridge, name, override_set=False, description=None):
+    def __init__(self, bridge, name, override_set=False, description=None,
+                 cache=False):
         self._bridge_ = bridge
         if not override_set:
             name = bridge.set(name)['data']
         self._name_ = name
+        self._cache_ = cache
+        self._children_ = {}
         self._description_ = description
+        self._generation_ = bridge.generation
+
+    def __cached__(self):
+        """Returns True if the cached data of the object is still valid."""
+        if not self._cache_ or self._generation_ != self._bridge_.generation:
+            return False
+        return self._description_ is not None
 
     def __jsget__(self, name):
         """Abstraction for final step in get events __getitem__/__getattr__."""
-        result = create_jsobject(self._bridge_, name, override_set=True)
-        return result
+        if not self._cache_:
+            return create_jsobject(self._bridge_, name, override_set=True)
+
+        if not self.__cached__() or name not in self._children_:
+            self._children_[name] = create_jsobject(self._bridge_, name,
+                                                    override_set=True,
+                                                    cache=True)
+        return self._children_[name]
 
     def __attributes__(self):
         """Returns the attributes in the object."""
-        return self._bridge_.describe(self._name_)['attributes']
+        if self.__cached__():
+            return self._description_['attributes']
+
+        description = self._bridge_.describe(self._name_)
+        if self._cache_:
+            self._children_ = {}
+            self._description_ = description
+            self._generation_ = self._bridge_.generation
+        return description['attributes']
 
     def __iter__(self):
         for i in self.__attributes__():
@@ -117,7 +151,8 @@ class JSObject(object):
         response = self._bridge_.setAttribute(self._name_, name, value)
         object.__setattr__(self, name, create_jsobject(self._bridge_,
                                                        response['data'],
-                                                       override_set=True))
+                                                       override_set=True,
+                                                       cache=self._cache_))
 
     __setitem__ = __setattr__
 
@@ -129,16 +164,20 @@ class JSFunction(JSObject):
     name set to the full javascript call for this function.
 
     """
-    def __init__(self, bridge, name, override_set=False, description=None):
+    def __init__(self, bridge, name, override_set=False, description=None,
+                 cache=False):
         self._bridge_ = bridge
         self._name_ = name
+        self._cache_ = cache
+        self._children_ = {}
         self._description_ = description
+        self._generation_ = bridge.generation
 
     def __call__(self, *args):
         response = self._bridge_.execFunction(self._name_, args)
         if response['data'] is not None:
             return create_jsobject(self._bridge_, response['data'],
-                                   override_set=True)
+                                   override_set=True, cache=self._cache_)
 
 
 class JSString(JSObject, unicode):
@@ -2,58 +2,261 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, you can obtain one at http://mozilla.org/MPL/2.0/.
 
-import asyncore
-import inspect
+import errno
 import json
 import socket
 import select
-from threading import Thread
-from time import sleep
+from threading import Event, Lock, Thread
+import time
+import traceback
 import uuid
 
 from .jsobjects import JSObject
-from .errors import ConnectionError
+from .errors import ConnectionError, JavaScriptError
 
 
-class Telnet(asyncore.dispatcher):
-    def __init__(self, host, port):
+# socket errors which only indicate that the operation has to be retried
+RETRY_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+def socketpair():
+    """Returns a pair of connected sockets, also on Windows."""
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    writer = socket.create_connection(listener.getsockname())
+    reader = listener.accept()[0]
+    listener.close()
+
+    return writer, reader
+
+
+class EventLoop(object):
+    """Dispatches the socket events of jsbridge channels on its own thread.
+
+    Each network gets its own loop by default, so there is no global state
+    which has to be reset between connections. Channels of several
+    applications can nevertheless share a loop by passing the same instance
+    to create_network(). The thread is started when the first channel gets
+    added, and exits when the last one has been removed.
+
+    """
+
+    def __init__(self, timeout=30.):
+        self.timeout = timeout
+        self.channels = {}
+        self.lock = Lock()
+        self.thread = None
+        self.waker = self.wakeup_reader = None
+
+        # time of the last data received by any of the channels, so that
+        # back channel events also keep pending bridge calls alive
+        self.last_activity = time.time()
+
+    def add(self, channel):
+        with self.lock:
+            self.channels[channel.socket.fileno()] = channel
+
+            if self.thread is None:
+                self.waker, self.wakeup_reader = socketpair()
+                self.wakeup_reader.setblocking(0)
+
+                self.thread = Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+
+        self.wakeup()
+
+    def remove(self, channel):
+        with self.lock:
+            for fd, _channel in self.channels.items():
+                if _channel is channel:
+                    del self.channels[fd]
+
+        self.wakeup()
+
+    def wakeup(self):
+        """Interrupt the wait of the thread to update the watched sockets."""
+        try:
+            self.waker.send('\0')
+        except (AttributeError, socket.error):
+            pass
+
+    def poll(self, readers, writers):
+        """Wait for the given file descriptors to become ready."""
+        if not hasattr(select, 'poll'):
+            readable, writable, _ = select.select(readers, writers, [],
+                                                  self.timeout)
+            return readable, writable
+
+        poller = select.poll()
+        for fd in readers:
+            poller.register(fd, select.POLLIN | select.POLLPRI)
+        for fd in writers:
+            poller.register(fd, select.POLLOUT)
+
+        readable, writable = [], []
+        for fd, flags in poller.poll(self.timeout * 1000):
+            if flags & (select.POLLIN | select.POLLPRI | select.POLLHUP |
+                        select.POLLERR | select.POLLNVAL):
+                readable.append(fd)
+            if flags & select.POLLOUT:
+                writable.append(fd)
+        return readable, writable
+
+    def run(self):
+        wakeup_fd = self.wakeup_reader.fileno()
+
+        while True:
+            with self.lock:
+                if not self.channels:
+                    self.thread = None
+                    self.waker.close()
+                    self.wakeup_reader.close()
+                    return
+
+                channels = dict(self.channels)
+
+            writers = [fd for fd, channel in channels.items()
+                       if channel.writable()]
+            try:
+                readable, writable = self.poll(channels.keys() + [wakeup_fd],
+                                               writers)
+            except (select.error, socket.error):
+                # a channel has been closed while waiting
+                continue
+
+            for fd in readable:
+                if fd == wakeup_fd:
+                    try:
+                        self.wakeup_reader.recv(4096)
+                    except socket.error:
+                        pass
+                else:
+                    self.last_activity = time.time()
+                    self.call(channels[fd], 'handle_read')
+
+            for fd in writable:
+                self.call(channels[fd], 'handle_write')
+
+    def call(self, channel, name):
+        """Call a handler of the channel, and close the channel on errors.
+
+        An exception, e.g. raised by a listener, must not end the thread,
+        which would leave all waiting callers hanging until their timeout.
+        Closing the channel wakes them up instead.
+
+        """
+        if not channel.connected:
+            return
+
+        try:
+            getattr(channel, name)()
+        except Exception:
+            traceback.print_exc()
+            try:
+                channel.handle_close()
+            except Exception:
+                traceback.print_exc()
+
+
+class Telnet(object):
+    """Non-blocking client connection which is served by an EventLoop.
+
+    If a socket is given, it is used instead of connecting to host and port,
+    e.g. for connections accepted by a Listener.
+
+    """
+
+    def __init__(self, host, port, loop=None, sock=None):
         self.host, self.port = host, port
-        asyncore.dispatcher.__init__(self)
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connect((host, port))
+        self.loop = loop or EventLoop()
+
+        # outgoing data which couldn't be sent yet
         self.buffer = ''
+        self.send_lock = Lock()
+
+        self.socket = sock or socket.create_connection((host, port))
+        self.socket.setblocking(0)
+        self.connected = True
+
+        self.handle_connect()
+        self.loop.add(self)
 
     def __del__(self):
         self.close()
 
-    def handle_close(self):
-        """override method of asyncore.dispatcher"""
-        self.close()
+    def close(self):
+        if not getattr(self, 'connected', False):
+            return
+
+        self.connected = False
+        self.loop.remove(self)
+        self.socket.close()
+
+    def handle_connect(self):
+        pass
 
-    def handle_expt(self):
-        # connection failed, shutdown
+    def handle_close(self):
         self.close()
 
     def writable(self):
         return (len(self.buffer) > 0)
 
+    def send(self, data):
+        """Send data right away, and leave the rest to the event loop."""
+        if not self.connected:
+            raise socket.error(errno.ENOTCONN, 'Socket is not connected')
+
+        with self.send_lock:
+            self.buffer += data
+            self.flush()
+
+        if self.buffer:
+            self.loop.wakeup()
+
+    def flush(self):
+        while self.buffer:
+            try:
+                sent = self.socket.send(self.buffer)
+            except socket.error as e:
+                if e.args[0] in RETRY_ERRORS:
+                    break
+                raise
+            self.buffer = self.buffer[sent:]
+
     def handle_write(self):
-        sent = self.send(self.buffer)
-        self.buffer = self.buffer[sent:]
+        try:
+            with self.send_lock:
+                self.flush()
+        except socket.error:
+            self.handle_close()
 
     def read_all(self):
-        data = ''
-        while self.connected:
+        """Returns all available data and whether the connection is closed."""
+        chunks = []
+        while True:
             try:
-                data += self.recv(4096)
-            except socket.error:
-                # Necessary for Python <2.7.2. See bug 722707
-                break
-        return data
+                data = self.socket.recv(65536)
+            except socket.error as e:
+                return ''.join(chunks), e.args[0] not in RETRY_ERRORS
+            if not data:
+                return ''.join(chunks), True
+            chunks.append(data)
 
     def handle_read(self):
-        data = self.read_all()
-        self.process_read(data)
+        data, closed = self.read_all()
+        if data:
+            self.process_read(data)
+        if closed:
+            self.handle_close()
+
+    def process_read(self, data):
+        pass
+
 
 decoder = json.JSONDecoder()
 
@@ -75,31 +278,65 @@ class Bridge(Telnet):
     sbuffer = ''
     events_list = []
 
-    callbacks = {}
-
     bridge_type = "bridge"
 
     registered = False
 
-    # global timeout counter
-    timeout_ctr = 0.
+    # framing of the messages from the extension, negotiated on registration:
+    # None -- raw json objects, which have to be searched in the data stream
+    # 'nul' -- json messages delimited by a NUL character
+    # 'nul-event' -- like 'nul', but events are preceded by a header line
+    #                '@<eventType>', so they can be skipped without decoding
+    framing = None
+    requested_framing = 'nul'
 
-    def __init__(self, host, port, timeout=60.):
+    # incremented for each operation which could modify javascript objects,
+    # and used by JSObject to invalidate its cached descriptions
+    generation = 0
+
+    def __init__(self, host, port, timeout=60., loop=None, sock=None):
         """
         - timeout : failsafe timeout for each call to run in seconds
+        - loop : EventLoop to serve the connection with
+        - sock : already connected socket to use
         """
         self.timeout = timeout
-        Telnet.__init__(self, host, port)
-        sleep(.1)
 
-        # XXX we've actually already connected in Telnet
-        self.connect((host, port))
+        # received data of framed messages, and how much of it has already
+        # been searched for the end of a message
+        self.rbuffer = bytearray()
+        self.rbuffer_scanned = 0
+
+        # responses which are still waited for by uuid
+        self.pending = {}
+        self.pending_lock = Lock()
+
+        Telnet.__init__(self, host, port, loop, sock)
 
     def handle_connect(self):
         self.register()
 
-    def run(self, _uuid, exec_string, interval=.2, raise_exeption=True):
-        socket_error = None
+    def handle_close(self):
+        Telnet.handle_close(self)
+
+        # wake up all callers still waiting for a response
+        with self.pending_lock:
+            for response in self.pending.values():
+                response.event.set()
+
+    def run(self, _uuid, exec_string, interval=.2, raise_exeption=True,
+            blocking=True):
+        """Send a command and wait for its response.
+
+        With blocking set to False the Response is returned immediately, so
+        that several commands can be in flight at the same time.
+
+        """
+        # register before sending so an early response can't get lost
+        response = Response(self, _uuid, exec_string)
+        with self.pending_lock:
+            self.pending[_uuid] = response
+        self.loop.last_activity = time.time()
 
         exec_string += '\r\n'
         try:
@@ -108,67 +345,99 @@ class Bridge(Telnet):
             print str(e)
             print "String: %s" % exec_string
 
-        while _uuid not in self.callbacks.keys():
-            Bridge.timeout_ctr += interval
-            if Bridge.timeout_ctr > self.timeout:
-                print 'Timeout: %s' % exec_string
-                raise ConnectionError("Connection timed out")
-
-            sleep(interval)
-            try:
-                self.send('')
-            except socket.error:
-                # Necessary for Python <2.7.2. See bug 764643
-                socket_error = True
-
-            if not self.connected or socket_error:
-                raise ConnectionError("Connection disconnected")
-
-        # reset the counter
-        Bridge.timeout_ctr = 0.
-
-        callback = self.callbacks.pop(_uuid)
-        if callback['result'] is False and raise_exeption is True:
-            raise errors.JavaScriptError(callback['exception'])
-        return callback
+        if not blocking:
+            return response
+        return response.result(interval, raise_exeption)
 
     def register(self):
         _uuid = str(uuid.uuid1())
-        self.send('bridge.register("' + _uuid + '", "' +
-                  self.bridge_type + '")\r\n')
+        exec_args = [encoder.encode(_uuid), encoder.encode(self.bridge_type),
+                     encoder.encode({'framing': self.requested_framing})]
+        self.send('bridge.register(' + ', '.join(exec_args) + ')\r\n')
         self.registered = True
 
-    def execFunction(self, func_name, args, interval=.25):
+    def execFunction(self, func_name, args, interval=.25, blocking=True):
+        self.generation += 1
+
         _uuid = str(uuid.uuid1())
         exec_args = [encoder.encode(_uuid), func_name, encoder.encode(args)]
         return self.run(_uuid, 'bridge.execFunction(' +
-                        ', '.join(exec_args) + ')', interval)
+                        ', '.join(exec_args) + ')', interval,
+                        blocking=blocking)
+
+    def setAttribute(self, obj_name, name, value, blocking=True):
+        self.generation += 1
 
-    def setAttribute(self, obj_name, name, value):
         _uuid = str(uuid.uuid1())
         exec_args = [encoder.encode(_uuid), obj_name,
                      encoder.encode(name), encoder.encode(value)]
         return self.run(_uuid, 'bridge.setAttribute('
-                        + ', '.join(exec_args) + ')')
+                        + ', '.join(exec_args) + ')', blocking=blocking)
 
-    def set(self, obj_name):
+    def set(self, obj_name, blocking=True):
         _uuid = str(uuid.uuid1())
         return self.run(_uuid, 'bridge.set(' +
-                        ', '.join([encoder.encode(_uuid), obj_name]) + ')')
+                        ', '.join([encoder.encode(_uuid), obj_name]) + ')',
+                        blocking=blocking)
 
-    def describe(self, obj_name):
+    def describe(self, obj_name, blocking=True):
         _uuid = str(uuid.uuid1())
         return self.run(_uuid, 'bridge.describe(' +
-                        ', '.join([encoder.encode(_uuid), obj_name]) + ')')
+                        ', '.join([encoder.encode(_uuid), obj_name]) + ')',
+                        blocking=blocking)
+
+    def batch(self):
+        """Returns a new batch to queue operations for a single round trip."""
+        return Batch(self)
 
     def fire_callbacks(self, obj):
         if 'uuid' not in obj and 'exception' in obj:
             # harness failure
-            raise errors.JavaScriptError(obj['exception']['message'])
-        self.callbacks[obj['uuid']] = obj
+            raise JavaScriptError(obj['exception']['message'])
+
+        # hand the data to the caller waiting for this response
+        with self.pending_lock:
+            response = self.pending.pop(obj['uuid'], None)
+        if response is not None:
+            response.set(obj)
+
+    def handle_message(self, obj):
+        """Fire the callbacks for a message received from the extension."""
+        if obj.get('eventType') == 'register' and obj.get('framing'):
+            # the extension has confirmed the requested framing
+            self.framing = obj['framing']
+
+        self.fire_callbacks(obj)
+
+    def handle_frame(self, data, start, end):
+        """Decode and handle the message in data[start:end]."""
+        if data[start] == ord('@'):
+            # skip the header of an event
+            start = data.index('\n', start, end) + 1
+        self.handle_message(json.loads(str(data[start:end])))
+
+    def process_frames(self, data):
+        """Decode each NUL delimited message once it has been received."""
+        self.rbuffer.extend(data)
+
+        start = 0
+        while True:
+            end = self.rbuffer.find('\0', max(start, self.rbuffer_scanned))
+            if end == -1:
+                break
+
+            if end > start:
+                self.handle_frame(self.rbuffer, start, end)
+            start = end + 1
+
+        del self.rbuffer[:start]
+        self.rbuffer_scanned = len(self.rbuffer)
 
     def process_read(self, data):
         """Parse out json objects and fire callbacks."""
+        if self.framing:
+            return self.process_frames(data)
+
         self.sbuffer += data
         self.reading = True
         self.parsing = True
@@ -184,30 +453,208 @@ class Bridge(Telnet):
                 self.parsing = False
                 # If we got an object fire the callback infra
             if self.parsing:
-                self.fire_callbacks(obj)
                 self.sbuffer = self.sbuffer[index:]
+                self.handle_message(obj)
+
+                if self.framing:
+                    # framing has been negotiated for all following messages
+                    data, self.sbuffer = self.sbuffer, ''
+                    return self.process_frames(data)
+
+
+class Response(object):
+    """Response of a command sent through the bridge.
+
+    The event loop fills in the data as soon as the response has been
+    received. Use result() to wait for it.
+
+    """
+
+    def __init__(self, bridge, _uuid, exec_string):
+        self.bridge = bridge
+        self.uuid = _uuid
+        self.exec_string = exec_string
+        self.event = Event()
+        self.data = None
+
+    def set(self, data):
+        self.data = data
+        self.event.set()
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, interval=.2, raise_exeption=True):
+        """Block until the response has been received and return its data.
+
+        The interval only determines how often the connection state and the
+        timeout of the bridge get checked meanwhile.
+
+        """
+        bridge = self.bridge
+        socket_error = None
+
+        try:
+            while not self.event.wait(interval):
+                if time.time() - bridge.loop.last_activity > bridge.timeout:
+                    print 'Timeout: %s' % self.exec_string
+                    raise ConnectionError("Connection timed out")
+
+                try:
+                    bridge.send('')
+                except socket.error:
+                    # Necessary for Python <2.7.2. See bug 764643
+                    socket_error = True
+
+                if not bridge.connected or socket_error:
+                    raise ConnectionError("Connection disconnected")
+        finally:
+            with bridge.pending_lock:
+                bridge.pending.pop(self.uuid, None)
+
+        # the event has also been set if the connection got closed
+        if self.data is None:
+            raise ConnectionError("Connection disconnected")
+
+        if self.data['result'] is False and raise_exeption is True:
+            raise JavaScriptError(self.data['exception'])
+        return self.data
+
+
+class Batch(object):
+    """Queue of bridge operations which are sent with a single round trip.
+
+    Operations are executed in the order they have been added, and each
+    object name gets only resolved when its operation is executed. So later
+    operations can make use of the side effects of former ones:
+
+        batch = bridge.batch()
+        batch.setAttribute('frame', 'persisted', persisted)
+        batch.describe('frame.persisted')
+        set_response, describe_response = batch.send()
+
+    """
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.operations = []
+        self.modifying = False
+
+    def __len__(self):
+        return len(self.operations)
+
+    def add(self, operation, *args):
+        """Queue an operation with the given javascript argument strings."""
+        self.operations.append('[%s, function () { return [%s]; }]' %
+                               (encoder.encode(operation), ', '.join(args)))
+
+    def execFunction(self, func_name, args):
+        self.modifying = True
+        self.add('execFunction', func_name, encoder.encode(args))
+
+    def setAttribute(self, obj_name, name, value):
+        self.modifying = True
+        self.add('setAttribute', obj_name, encoder.encode(name),
+                 encoder.encode(value))
+
+    def set(self, obj_name):
+        self.add('set', obj_name)
+
+    def describe(self, obj_name):
+        self.add('describe', obj_name)
+
+    def send(self, raise_exeption=True):
+        """Send all queued operations and return the list of responses.
+
+        Each response has the same format as the one of the single call.
+
+        """
+        if self.modifying:
+            self.bridge.generation += 1
+
+        _uuid = str(uuid.uuid1())
+        operations, self.operations = self.operations, []
+        self.modifying = False
+        callback = self.bridge.run(_uuid, 'bridge.batch(' +
+                                   encoder.encode(_uuid) + ', [' +
+                                   ', '.join(operations) + '])',
+                                   raise_exeption=raise_exeption)
+
+        responses = callback['data']
+        if raise_exeption is True:
+            for response in responses:
+                if response['result'] is False:
+                    raise JavaScriptError(response['exception'])
+        return responses
 
 
 class BackChannel(Bridge):
     bridge_type = "backchannel"
+    requested_framing = 'nul-event'
 
-    def __init__(self, host, port):
-        Bridge.__init__(self, host, port)
+    def __init__(self, host, port, loop=None, sock=None):
         self.uuid_listener_index = {}
         self.event_listener_index = {}
         self.global_listeners = []
 
+        # tuples of the listeners above, compiled whenever listeners get
+        # added or removed, so firing an event needs no further lookups
+        self.uuid_callbacks = {}
+        self.event_callbacks = {}
+        self.global_callbacks = ()
+
+        # whether events of a type have to be decoded, by event type
+        self.wanted_events = {}
+
+        Bridge.__init__(self, host, port, loop=loop, sock=sock)
+
+    def compile_callbacks(self):
+        self.uuid_callbacks = dict([(key, tuple(callbacks))
+                                    for key, callbacks
+                                    in self.uuid_listener_index.items()
+                                    if callbacks])
+        self.event_callbacks = dict([(key, tuple(callbacks))
+                                     for key, callbacks
+                                     in self.event_listener_index.items()
+                                     if callbacks])
+        self.global_callbacks = tuple(self.global_listeners)
+        self.wanted_events = {}
+
+    def wants_event(self, eventType):
+        """Returns whether any listener is interested in the event type.
+
+        Global listeners can decline event types with an accepts(eventType)
+        method, all others get every event. The decisions are cached until
+        listeners get added or removed, so accepts() has to return the same
+        answer for as long as the listener is registered.
+
+        """
+        wanted = self.wanted_events.get(eventType)
+        if wanted is None:
+            wanted = (eventType in self.event_callbacks or
+                      any(not hasattr(listener, 'accepts') or
+                          listener.accepts(eventType)
+                          for listener in self.global_callbacks))
+            self.wanted_events[eventType] = wanted
+        return wanted
+
+    def handle_frame(self, data, start, end):
+        if data[start] == ord('@'):
+            # skip decoding events nobody listens to
+            header_end = data.index('\n', start, end)
+            if not self.wants_event(str(data[start + 1:header_end])):
+                return
+            start = header_end + 1
+
+        Bridge.handle_frame(self, data, start, end)
+
     def fire_callbacks(self, obj):
         """Handle all callback firing on json objects pulled
         from the data stream.
 
         """
-        # no 'self' (key: 0)
-        args = inspect.getargspec(self.fire_event).args[1:]
-
-        self.fire_event(**dict([(str(key), value,)
-                            for key, value in obj.items()
-                                if key in args]))
+        self.fire_event(obj.get('eventType'), obj.get('uuid'),
+                        obj.get('result'), obj.get('exception'))
 
     def add_listener(self, callback, uuid=None, eventType=None):
         if uuid is not None:
@@ -215,40 +662,115 @@ class BackChannel(Bridge):
         if eventType is not None:
             self.event_listener_index.setdefault(eventType,
                                                  []).append(callback)
+        self.compile_callbacks()
 
     def add_global_listener(self, callback):
         self.global_listeners.append(callback)
+        self.compile_callbacks()
+
+    def remove_listener(self, callback, uuid=None, eventType=None):
+        if uuid is not None:
+            self.uuid_listener_index.get(uuid, []).remove(callback)
+        if eventType is not None:
+            self.event_listener_index.get(eventType, []).remove(callback)
+        self.compile_callbacks()
+
+    def flush_events(self, bridge, timeout=None):
+        """Wait until all events fired by the extension have been received.
+
+        The extension fires a marker event after the pending events, and the
+        events of the back channel are received and handled in order.
+
+        Returns False if the marker didn't arrive within the timeout.
+
+        """
+        _uuid = str(uuid.uuid1())
+        received = Event()
+
+        def listener(result):
+            if result == _uuid:
+                received.set()
+
+        self.add_listener(listener, eventType='jsbridge.flush')
+        try:
+            bridge.run(_uuid, 'bridge.flush(%s)' % encoder.encode(_uuid))
+            return received.wait(timeout or bridge.timeout)
+        finally:
+            self.remove_listener(listener, eventType='jsbridge.flush')
 
     def fire_event(self, eventType=None, uuid=None, result=None,
                    exception=None):
-        # reset the counter
-        Bridge.timeout_ctr = 0.
-
-        if uuid is not None and uuid in self.uuid_listener_index:
-            for callback in self.uuid_listener_index[uuid]:
+        if uuid is not None:
+            for callback in self.uuid_callbacks.get(uuid, ()):
                 callback(result)
-        if eventType is not None and eventType in self.event_listener_index:
-            for callback in self.event_listener_index[eventType]:
+        if eventType is not None:
+            for callback in self.event_callbacks.get(eventType, ()):
                 callback(result)
-        for listener in self.global_listeners:
+        for listener in self.global_callbacks:
             listener(eventType, result)
 
-thread = None
-
+def create_network(hostname, port, loop=None):
+    """Connect the back channel and the bridge to the extension.
 
-def create_network(hostname, port):
-    back_channel = BackChannel(hostname, port)
-    bridge = Bridge(hostname, port)
-    global thread
-    if not thread or not thread.isAlive():
-        def do():
-            try:
-                asyncore.loop(use_poll=True)
-            except select.error:
-                pass
+    Both channels are served by the given EventLoop, or by a new one.
 
-        thread = Thread(target=do)
-        getattr(thread, 'setDaemon', lambda x: None)(True)
-        thread.start()
+    """
+    loop = loop or EventLoop()
+    back_channel = BackChannel(hostname, port, loop=loop)
+    try:
+        bridge = Bridge(hostname, port, loop=loop)
+    except:
+        # don't leave the back channel behind for each retry
+        back_channel.close()
+        raise
 
     return back_channel, bridge
+
+
+class Listener(object):
+    """Accepts the connections of an extension started in reverse mode.
+
+    With the extensions.jsbridge.reverse preference set, the extension
+    doesn't start a server but connects back to the given port for each of
+    the channels as soon as it has been loaded. The listener has to be
+    created before the application gets started, and can be reused for
+    restarts of the application.
+
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.listen(5)
+
+    def accept(self, timeout):
+        self.socket.settimeout(max(timeout, 0))
+        try:
+            sock = self.socket.accept()[0]
+        except socket.timeout:
+            raise ConnectionError("Extension did not connect back to port %s" %
+                                  self.port)
+
+        return sock
+
+    def create_network(self, timeout=60., loop=None):
+        """Accept the back channel and the bridge from the extension."""
+        deadline = time.time() + timeout
+        loop = loop or EventLoop()
+
+        back_channel = BackChannel(self.host, self.port, loop=loop,
+                                   sock=self.accept(deadline - time.time()))
+        try:
+            bridge = Bridge(self.host, self.port, loop=loop,
+                            sock=self.accept(deadline - time.time()))
+        except:
+            back_channel.close()
+            raise
+
+        return back_channel, bridge
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,92 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Micro-benchmark for the round-trip latency of jsbridge calls.
+
+A minimal stand-in for the jsbridge extension answers every bridge command
+immediately, so the measured time is the overhead of the Python side only.
+
+Usage: python benchmark_roundtrip.py [calls]
+"""
+
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsbridge
+
+uuid_regex = re.compile(r'^bridge\.(\w+)\("([^"]+)"')
+
+
+def serve_client(client):
+    """Answer each bridge command with a successful describe() response."""
+    data = ''
+    while True:
+        chunk = client.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+        while '\r\n' in data:
+            line, data = data.split('\r\n', 1)
+            match = uuid_regex.match(line)
+            if not match:
+                continue
+            response = {'result': True, 'uuid': match.group(2),
+                        'type': 'object', 'attributes': []}
+            if match.group(1) == 'register':
+                response['eventType'] = 'register'
+                if '"framing": "nul"' in line:
+                    response['framing'] = 'nul'
+            client.sendall(json.dumps(response) + '\0')
+    client.close()
+
+
+def start_server(port):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(5)
+
+    def accept():
+        while True:
+            client, addr = server.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=serve_client, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+
+
+def main(calls=200):
+    port = jsbridge.find_port()
+    start_server(port)
+
+    back_channel, bridge = jsbridge.wait_and_create_network('127.0.0.1', port)
+
+    start = time.time()
+    for i in range(calls):
+        bridge.describe('window')
+    elapsed = time.time() - start
+
+    print '%d round trips in %.3fs (%.3fms per call)' % (calls, elapsed,
+                                                         elapsed * 1000 / calls)
+
+    thread = bridge.loop.thread
+    back_channel.close()
+    bridge.close()
+    if thread:
+        thread.join()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -11,7 +11,7 @@ import os
 import socket
 import sys
 import tempfile
-from time import sleep
+import threading
 import traceback
 
 from manifestparser import TestManifest
@@ -24,6 +24,12 @@ import wptserve
 
 import jsbridge
 from .errors import *
+from . import dispatch
+from . import filecache
+from . import history
+from . import pool
+from . import profiles
+from .results import DetailStore, TestRecord
 
 # metadata
 package_metadata = get_metadata_from_egg('mozmill')
@@ -47,15 +53,32 @@ ENVIRONMENT = {
 
 
 class TestResults(object):
-    """Class to accumulate test results and other information."""
+    """Class to accumulate test results and other information.
+
+    Each test is stored as a compact TestRecord. To keep the memory usage
+    flat for long runs, the details of the passes and fails can be written
+    to disk, and the details of passes can be dropped once counted.
+
+    """
+
+    def __init__(self, spill=False, keep_passes=True):
+        """Constructor of the TestResults class.
+
+        Keyword arguments:
+        spill -- Store the details of the tests in a temporary file
+        keep_passes -- Keep the details of the passes of tests
+
+        """
+        self.store = DetailStore() if spill else None
+        self.keep_passes = keep_passes
 
-    def __init__(self):
         # application information
         self.appinfo = {}
 
         # other information
         self.mozmill_version = package_metadata.get('Version')
         self.screenshots = []
+        self.screenshot_hashes = {}
 
         # test statistics
         self.alltests = []
@@ -71,9 +94,15 @@ class TestResults(object):
         """Events, the MozMill class will dispatch to."""
         return {'mozmill.endTest': self.endTest_listener}
 
+    def create_record(self, test):
+        """Create a record for the test as configured."""
+        return TestRecord(test, store=self.store,
+                          keep_passes=self.keep_passes)
+
     ### event listener
     def endTest_listener(self, test):
         """Add current test result to results."""
+        test = self.create_record(test)
         self.alltests.append(test)
         if test.get('skipped', False):
             self.skipped.append(test)
@@ -88,6 +117,163 @@ class TestResults(object):
             else:
                 self.passes.append(test)
 
+    def add_screenshot(self, screenshot):
+        """Add a screenshot to the results.
+
+        Screenshots with the same content are listed only once. Further
+        occurrences get added as duplicates to the first one.
+
+        """
+        original = self.screenshot_hashes.get(screenshot.get('hash'))
+        if original is None:
+            if screenshot.get('hash'):
+                self.screenshot_hashes[screenshot['hash']] = screenshot
+            self.screenshots.append(screenshot)
+            return
+
+        duplicate = dict(screenshot)
+        duplicates = duplicate.pop('duplicates', [])
+        for key in ('filename', 'hash', 'dataURL'):
+            duplicate.pop(key, None)
+
+        original.setdefault('duplicates', []).append(duplicate)
+        original['duplicates'].extend(duplicates)
+
+    def merge(self, results):
+        """Add the results of another (parallel) run to these results."""
+        if not self.appinfo:
+            self.appinfo = results.appinfo
+
+        for screenshot in results.screenshots:
+            self.add_screenshot(screenshot)
+        self.alltests.extend(results.alltests)
+        self.fails.extend(results.fails)
+        self.passes.extend(results.passes)
+        self.skipped.extend(results.skipped)
+
+        self.starttime = min(self.starttime, results.starttime)
+        if results.endtime:
+            self.endtime = max(self.endtime or results.endtime,
+                               results.endtime)
+
+    def close(self):
+        """Remove the stored details of the tests.
+
+        Only the summaries of the tests are available afterwards.
+
+        """
+        if self.store is not None:
+            self.store.close()
+
+
+class SharedHandler(object):
+    """Forwards the events of a MozMill instance to a shared event handler.
+
+    When several MozMill instances run in parallel their events get fired
+    from different threads. SharedHandler serializes the calls, and points
+    the handler's mozmill attribute to the instance which fired the event.
+    The handler doesn't get stopped by the instance, so it can be stopped
+    once with the merged results of all instances.
+
+    """
+
+    lock = threading.RLock()
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.mozmill = None
+
+    def forward(self, method):
+        def listener(*args):
+            with self.lock:
+                self.handler.mozmill = self.mozmill
+                return method(*args)
+        return listener
+
+    def events(self):
+        if not hasattr(self.handler, 'events'):
+            return {}
+        return dict([(event, self.forward(method))
+                     for event, method in self.handler.events().items()])
+
+    def __call__(self, event, obj):
+        if hasattr(self.handler, '__call__'):
+            self.forward(self.handler)(event, obj)
+
+    def accepts(self, event):
+        if not hasattr(self.handler, '__call__'):
+            return False
+        if not hasattr(self.handler, 'accepts'):
+            return True
+        return self.handler.accepts(event)
+
+
+class EventContext(object):
+    """State of a MozMill instance at the time an event has been fired.
+
+    Handlers run by a Dispatcher see the test the event belongs to, even if
+    the instance has already moved on to the next test.
+
+    """
+
+    def __init__(self, mozmill):
+        self.mozmill = mozmill
+        self.running_test = mozmill.running_test
+        self.current_test = getattr(mozmill, 'current_test', None)
+
+    def __getattr__(self, name):
+        return getattr(self.mozmill, name)
+
+
+class AsyncHandler(object):
+    """Runs the listeners of an event handler on a worker of a Dispatcher.
+
+    All events of the handler are run by the same worker in the order they
+    have been fired, so the handler doesn't need to be thread-safe. The
+    handler gets stopped once all its pending events have been handled.
+
+    """
+
+    def __init__(self, handler, dispatcher):
+        self.handler = handler
+        self.dispatcher = dispatcher
+        self.mozmill = None
+
+    def call(self, context, method, args):
+        self.handler.mozmill = context
+        method(*args)
+
+    def forward(self, method):
+        def listener(*args):
+            self.dispatcher.dispatch(self.handler, self.call,
+                                     EventContext(self.mozmill), method, args)
+        return listener
+
+    def events(self):
+        if not hasattr(self.handler, 'events'):
+            return {}
+        return dict([(event, self.forward(method))
+                     for event, method in self.handler.events().items()])
+
+    def __call__(self, event, obj):
+        if hasattr(self.handler, '__call__'):
+            self.forward(self.handler)(event, obj)
+
+    def accepts(self, event):
+        if not hasattr(self.handler, '__call__'):
+            return False
+        if not hasattr(self.handler, 'accepts'):
+            return True
+        return self.handler.accepts(event)
+
+    def stop(self, results, fatal):
+        self.dispatcher.join()
+
+        self.handler.mozmill = self.mozmill
+        if hasattr(self.handler, 'stop'):
+            self.handler.stop(results, fatal)
+        self.handler.mozmill = None
+
 
 class MozMill(object):
     """MozMill is a test runner.
@@ -103,7 +289,10 @@ class MozMill(object):
     @classmethod
     def create(cls, binary=None, jsbridge_timeout=JSBRIDGE_TIMEOUT,
                handlers=None, app='firefox', profile_args=None,
-               runner_args=None, screenshots_path=None, server_root=None):
+               runner_args=None, screenshots_path=None, server_root=None,
+               results=None, profile_cache=profiles.DEFAULT_CACHE_DIR,
+               screenshots_format=None, screenshots_quality=None,
+               server_cache=False):
 
         jsbridge_port = jsbridge.find_port()
 
@@ -135,6 +324,7 @@ class MozMill(object):
             preferences['browser.newtabpage.introShown'] = True
             preferences['browser.uitour.enabled'] = False
             preferences['extensions.jsbridge.port'] = jsbridge_port
+            preferences['extensions.jsbridge.reverse'] = True
             preferences['focusmanager.testmode'] = True
         elif isinstance(preferences, list):
             # Bug 695026 - Re-enable e10s when fully supported
@@ -150,6 +340,7 @@ class MozMill(object):
             preferences.append(('browser.newtabpage.introShown', True))
             preferences.append(('browser.uitour.enabled', False))
             preferences.append(('extensions.jsbridge.port', jsbridge_port))
+            preferences.append(('extensions.jsbridge.reverse', True))
             preferences.append(('focusmanager.testmode', True))
         else:
             raise Exception('Invalid type for preferences in profile_args')
@@ -157,8 +348,10 @@ class MozMill(object):
         # update environment variables for API usage
         os.environ.update(ENVIRONMENT)
 
-        # create an equipped runner
-        profile = profile_class(**profile_args)
+        # create an equipped runner, with the profile cloned from a cached
+        # template unless profile_cache is None
+        profile = profiles.create_profile(profile_class, profile_args,
+                                          profile_cache)
 
         # if no binary is given, take it from the browser path env variable
         binary = binary or os.environ.get('BROWSER_PATH', None)
@@ -169,12 +362,18 @@ class MozMill(object):
 
         # create a mozmill
         return cls(runner, jsbridge_port, jsbridge_timeout=jsbridge_timeout,
-                   handlers=handlers, screenshots_path=screenshots_path,
-                   server_root=server_root)
+                   jsbridge_reverse=True, handlers=handlers,
+                   screenshots_path=screenshots_path,
+                   server_root=server_root, results=results,
+                   screenshots_format=screenshots_format,
+                   screenshots_quality=screenshots_quality,
+                   server_cache=server_cache)
 
     def __init__(self, runner, jsbridge_port,
-                 jsbridge_timeout=JSBRIDGE_TIMEOUT, handlers=None,
-                 screenshots_path=None, server_root=None):
+                 jsbridge_timeout=JSBRIDGE_TIMEOUT, jsbridge_reverse=False,
+                 handlers=None, screenshots_path=None, server_root=None,
+                 results=None, handler_workers=0, screenshots_format=None,
+                 screenshots_quality=None, server_cache=False):
         """Constructor of the Mozmill class.
 
         Arguments:
@@ -183,15 +382,25 @@ class MozMill(object):
 
         Keyword arguments:
         jsbridge_timeout -- How long to wait without a jsbridge communication
+        jsbridge_reverse -- Listen on the jsbridge port for the extension to
+                            connect back (extensions.jsbridge.reverse)
         handlers -- pluggable event handlers
         screenshots_path -- Path where screenshots will be saved
         server_root -- Path where to serve testcase files from
+        results -- TestResults instance to store the results in
+        handler_workers -- Number of threads to run the event handlers on,
+                           instead of the thread which reads the events
+        screenshots_format -- Image format of saved screenshots ('jpeg' or
+                              'png')
+        screenshots_quality -- Quality of JPEG screenshots between 0 and 1
+        server_cache -- Serve the testcase files from an in-memory cache
 
         """
         # the MozRunner
         self.runner = runner
 
         self.server_root = server_root
+        self.server_cache = server_cache
         self.http_server_start()
 
         # execution parameters
@@ -203,8 +412,15 @@ class MozMill(object):
         self.jsbridge_timeout = jsbridge_timeout
         self.bridge = self.back_channel = None
 
+        # listen before the application gets started, so that the extension
+        # can connect back right away
+        self.jsbridge_listener = None
+        if jsbridge_reverse:
+            self.jsbridge_listener = jsbridge.Listener('127.0.0.1',
+                                                       jsbridge_port)
+
         # Report data will end up here
-        self.results = TestResults()
+        self.results = results or TestResults()
 
         # persisted data
         self.persisted = {}
@@ -230,11 +446,22 @@ class MozMill(object):
             if not os.path.isdir(path):
                 os.makedirs(path)
         self.persisted['screenshots']['path'] = screenshots_path or tempfile.mkdtemp()
+        if screenshots_format:
+            self.persisted['screenshots']['format'] = screenshots_format
+        if screenshots_quality:
+            self.persisted['screenshots']['quality'] = screenshots_quality
 
         # setup event handlers and register listeners
         self.setup_listeners()
 
+        # slow handlers must not block reading the events, but the results
+        # are part of the state and always get stored right away
+        self.dispatcher = None
         handlers = handlers or list()
+        if handler_workers > 0:
+            self.dispatcher = dispatch.Dispatcher(handler_workers)
+            handlers = [AsyncHandler(handler, self.dispatcher)
+                        for handler in handlers]
         handlers.append(self.results)
         self.setup_handlers(handlers)
 
@@ -304,7 +531,7 @@ class MozMill(object):
         self.shutdownMode = obj
 
     def screenshot_listener(self, obj):
-        self.results.screenshots.append(obj)
+        self.results.add_screenshot(obj)
 
     def fire_event(self, event, obj):
         """Fire an event from the python side."""
@@ -328,7 +555,8 @@ class MozMill(object):
         self.back_channel, \
         self.bridge = jsbridge.wait_and_create_network("127.0.0.1",
                                                        self.jsbridge_port,
-                                                       self.jsbridge_timeout)
+                                                       self.jsbridge_timeout,
+                                                       listener=self.jsbridge_listener)
         # set a timeout on jsbridge actions in order to ensure termination
         self.back_channel.timeout = self.bridge.timeout = self.jsbridge_timeout
 
@@ -357,7 +585,7 @@ class MozMill(object):
         if not self.shutdownMode.get('restart', False):
             if self.shutdownMode.get('resetProfile'):
                 # reset the profile
-                self.runner.reset()
+                self.reset_runner()
 
             self.runner.start(debug_args=self.debugger,
                               interactive=self.interactive)
@@ -384,10 +612,15 @@ class MozMill(object):
                                                        'pending')
 
         try:
-            frame = jsbridge.JSObject(self.bridge, js_module_frame)
-
-            # transfer persisted data
-            frame.persisted = self.persisted
+            # transfer persisted data and get a reference to the frame
+            # module within a single round trip
+            batch = self.bridge.batch()
+            batch.setAttribute(js_module_frame, 'persisted', self.persisted)
+            batch.set(js_module_frame)
+            frame_name = batch.send()[-1]['data']
+
+            frame = jsbridge.JSObject(self.bridge, frame_name,
+                                      override_set=True)
         except:
             raise
 
@@ -406,7 +639,11 @@ class MozMill(object):
         try:
             # set the document root
             self.http_server_set_document_root(test)
-            frame.runTestFile(test['path'], name)
+
+            # call the function directly to save the round trips needed
+            # to describe the frame and the function's return value
+            self.bridge.execFunction(frame._name_ + '.runTestFile',
+                                     [test['path'], name])
         except jsbridge.ConnectionError, e:
             # if the runner is restarted via JS, run this test
             # again if the next is specified
@@ -421,7 +658,31 @@ class MozMill(object):
 
         return frame
 
-    def run(self, tests, restart=False):
+    def reset_application(self, frame):
+        """Restore the initial state of the application without a restart.
+
+        Falls back to a restart if the application can't be reset via JS.
+        Returns the frame to use for the next test, or None if the
+        application has been stopped.
+
+        """
+        # wait until the persisted data of the last test has been received
+        try:
+            self.back_channel.flush_events(self.bridge)
+        except jsbridge.JavaScriptError:
+            pass
+
+        try:
+            self.bridge.execFunction(frame._name_ + '.resetApplication',
+                                     [self.persisted])
+        except jsbridge.JavaScriptError:
+            self.stop_runner()
+            self.reset_runner()
+            return None
+
+        return frame
+
+    def run(self, tests, restart=False, isolation=None):
         """Run all the tests.
 
         Arguments:
@@ -429,8 +690,15 @@ class MozMill(object):
 
         Keyword Arguments:
         restart -- If True the application will be restarted between each test
+        isolation -- How to isolate the tests from each other:
+                     'hard' restarts the application and resets the profile
+                     between each test like restart, 'soft' resets the state
+                     of the running application instead
 
         """
+        if restart:
+            isolation = 'hard'
+
         try:
             frame = None
 
@@ -464,11 +732,17 @@ class MozMill(object):
 
                     # If a restart is requested between each test stop the runner
                     # and reset the profile
-                    if restart:
+                    if isolation == 'hard':
                         self.stop_runner()
                         frame = None
 
-                        self.runner.reset()
+                        self.reset_runner()
+
+                    # Otherwise reset the state of the application if another
+                    # test is run in it. A test which restarted the application
+                    # or crashed already left the frame.
+                    elif isolation == 'soft' and frame and tests:
+                        frame = self.reset_application(frame)
 
                 except jsbridge.ConnectionError, e:
                     frame = None
@@ -508,6 +782,17 @@ class MozMill(object):
         if self.results.screenshots:
             print 'Screenshots saved in %s' % self.persisted['screenshots']['path']
 
+        # let the event handlers catch up
+        if self.dispatcher:
+            self.dispatcher.close()
+
+            stats = self.dispatcher.stats()
+            if stats['blocked']:
+                print 'Event handlers fell behind: %(blocked)d of ' \
+                    '%(dispatched)d events had to wait (max. %(max_pending)d ' \
+                    'pending)' % stats
+            self.dispatcher = None
+
         # handle stop events
         for handler in self.handlers:
             if hasattr(handler, 'stop'):
@@ -523,6 +808,10 @@ class MozMill(object):
         self.global_listeners = []
         self.handlers = []
 
+        if self.jsbridge_listener:
+            self.jsbridge_listener.close()
+            self.jsbridge_listener = None
+
         return self.results
 
     def check_for_crashes(self):
@@ -594,32 +883,48 @@ class MozMill(object):
 
 
         # Ensure that we log this disconnect as failure
+        obj = self.results.create_record(obj)
         self.results.alltests.append(obj)
         self.results.fails.append(obj)
 
         self.fire_event('disconnected', message)
 
     def stop_runner(self):
-        # Give a second for any callbacks to finish.
-        sleep(1)
+        # the network is gone if the application has already disconnected,
+        # or has never been set up if the startup failed
+        connected = self.bridge is not None and self.bridge.connected
+
+        # wait until all events fired so far have been received and handled
+        if connected and self.back_channel and self.back_channel.connected:
+            try:
+                self.back_channel.flush_events(self.bridge)
+            except (socket.error, jsbridge.ConnectionError,
+                    jsbridge.JavaScriptError):
+                pass
 
         # reset the shutdown mode
         self.shutdownMode = {}
 
-        # quit the application via JS
+        # quit the application via JS, which first sends all pending events
         # this *will* cause a disconnect error
         # (not sure what the socket.error is all about)
-        try:
-            frame = jsbridge.JSObject(self.bridge, js_module_frame)
-            frame.shutdownApplication()
-        except (socket.error, jsbridge.ConnectionError):
-            pass
+        if connected:
+            try:
+                self.bridge.execFunction(
+                    js_module_frame + '.shutdownApplication', [])
+            except (socket.error, jsbridge.ConnectionError):
+                pass
 
         # wait for the runner to stop
         self.runner.wait(timeout=self.jsbridge_timeout)
         if self.runner.is_running():
             raise errors.ShutdownError('client process shutdown unsuccessful')
 
+    def reset_runner(self):
+        """Reset the runner and restore the initial state of the profile."""
+        self.runner.reset()
+        self.runner.profile.reset()
+
     def kill_runner(self):
         # stop the back channel and bridge first
         if self.back_channel:
@@ -683,16 +988,31 @@ class MozMill(object):
                                                 test['server-root']))
         self.http_server.router.doc_root = root
 
+        if self.server_cache:
+            self.file_handler.preload(root)
+
     # init and start the http server
     def http_server_start(self):
+        # serve the files from memory if requested
+        self.file_handler = wptserve.handlers.file_handler
+        if self.server_cache:
+            self.file_handler = filecache.CachedFileHandler()
+            if self.server_root:
+                self.file_handler.preload(self.server_root)
+
+        routes = [(method, path, self.file_handler
+                   if handler is wptserve.handlers.file_handler else handler)
+                  for method, path, handler in wptserve.routes.routes]
+
         # start the server
         self.http_server = wptserve.server.WebTestHttpd(doc_root=self.server_root,
                                                         host='localhost',
-                                                        port=0)
+                                                        port=0,
+                                                        routes=routes)
         self.http_server.start()
 
         # Add a custom route for POST requests to the default file_handler
-        self.http_server.router.register(['POST'], '*', wptserve.handlers.file_handler)
+        self.http_server.router.register(['POST'], '*', self.file_handler)
 
         # expose the URL as a pref
         self.runner.profile.set_persistent_preferences({'extensions.mozmill.baseurl':
@@ -727,6 +1047,43 @@ def collect_tests(path):
 
 ### command line interface
 
+def cli_preferences(jsbridge_port, reverse=True, debug=False):
+    """Returns the preferences of the profiles created by the CLIs.
+
+    Arguments:
+    jsbridge_port -- The port the jsbridge server is running on
+
+    Keyword arguments:
+    reverse -- Let the extension connect back to the jsbridge port
+    debug -- Enable the logging and checks of debug mode
+
+    """
+    prefs = {
+        # Bug 695026 - Re-enable e10s when fully supported
+        'browser.displayedE10SPrompt': 5,
+        'browser.tabs.remote.autostart': False,
+
+        'browser.newtab.preload': False,
+        'browser.newtabpage.introShown': True,
+        'browser.uitour.enabled': False,
+        'extensions.jsbridge.port': jsbridge_port,
+        'extensions.jsbridge.reverse': reverse,
+        'focusmanager.testmode': True
+    }
+
+    # Bug 1081996: Separate fixes for each e10s testing duration
+    for i in range(1, 10):
+        prefs['browser.tabs.remote.autostart.%s' % i] = False
+        prefs['browser.displayedE10SPrompt.%s' % i] = 5
+
+    if debug:
+        prefs['extensions.checkCompatibility'] = False
+        prefs['extensions.jsbridge.log'] = True
+        prefs['javascript.options.strict'] = True
+
+    return prefs
+
+
 class CLI(mozrunner.CLI):
     """Command line interface to mozmill."""
 
@@ -799,10 +1156,49 @@ class CLI(mozrunner.CLI):
             if _handler is not None:
                 self.event_handlers.append(_handler)
 
+        # record the results of the tests for scheduling later runs
+        self.history = None
+        if self.options.history:
+            self.history = history.TestHistory(self.options.history)
+            self.event_handlers.append(self.history)
+        elif self.options.order != 'manifest':
+            self.parser.error("Option --order=%s requires the test history" %
+                              self.options.order)
+        elif self.options.last_failed or self.options.changed:
+            self.parser.error("Options --last-failed and "
+                              "--changed-since-last-run require the test "
+                              "history")
+
         # if in manual mode, ensure we're interactive
         if self.options.manual:
             self.options.interactive = True
 
+        if self.options.restart:
+            self.options.isolation = 'hard'
+
+        if self.options.handler_workers < 0:
+            self.parser.error("The number of handler workers can't be "
+                              "negative")
+
+        quality = self.options.screenshots_quality
+        if quality is not None and not 0 < quality <= 1:
+            self.parser.error("The quality of screenshots has to be "
+                              "between 0 and 1")
+
+        if self.options.parallel < 1:
+            self.parser.error("The number of parallel instances has to be "
+                              "at least 1")
+        if self.options.parallel > 1 and getattr(self.options, 'profile', None):
+            self.parser.error("Option --parallel can't be used with a "
+                              "given profile")
+        if self.options.pool:
+            if getattr(self.options, 'profile', None):
+                self.parser.error("Option --pool can't be used with a "
+                                  "given profile")
+            if getattr(self.options, 'debugger', None):
+                self.parser.error("Option --pool can't be used with a "
+                                  "debugger")
+
     def add_options(self, parser):
         """Add command line options."""
 
@@ -827,7 +1223,18 @@ class CLI(mozrunner.CLI):
                          action='store_true',
                          default=False,
                          help="Restart the application and reset the "
-                              "profile between each test file")
+                              "profile between each test file "
+                              "(same as --isolation=hard)")
+        group.add_option("--isolation",
+                         dest='isolation',
+                         choices=('none', 'soft', 'hard'),
+                         default='none',
+                         metavar='MODE',
+                         help="Isolation of the test files from each other: "
+                              "'soft' resets windows, preferences, cookies, "
+                              "and caches of the running application, "
+                              "'hard' restarts it with a reset profile "
+                              "(default: %default)")
         group.add_option("-m", "--manifest",
                          dest='manifests',
                          action='append',
@@ -850,14 +1257,108 @@ class CLI(mozrunner.CLI):
                          metavar='PATH:CLASS',
                          help="Specify an event handler given a file PATH "
                               "and the CLASS in the file")
+        group.add_option('--handler-workers',
+                         dest='handler_workers',
+                         type='int',
+                         default=0,
+                         metavar='N',
+                         help="Run the event handlers on N threads, so they "
+                              "don't block receiving events. Handlers have "
+                              "to cope with being called from another "
+                              "thread. 0 runs them right away when an event "
+                              "arrives (default: %default)")
         group.add_option('--screenshots-path',
                          dest='screenshots_path',
                          metavar='PATH',
                          help='Path of directory to use for screenshots')
+        group.add_option('--screenshots-format',
+                         dest='screenshots_format',
+                         choices=('jpeg', 'png'),
+                         metavar='FORMAT',
+                         help="Image format of saved screenshots, 'jpeg' or "
+                              "'png' (default: jpeg)")
+        group.add_option('--screenshots-quality',
+                         dest='screenshots_quality',
+                         type='float',
+                         metavar='QUALITY',
+                         help="Quality of JPEG screenshots, between 0 and 1 "
+                              "(default: 0.5)")
         group.add_option('--server-root',
                          dest='server_root',
                          default=None,
                          help='Document root for serving local testcases')
+        group.add_option('--server-cache',
+                         dest='server_cache',
+                         action='store_true',
+                         default=False,
+                         help="Preload the testcase files into memory, and "
+                              "serve them from there with ETag and "
+                              "Last-Modified headers")
+        group.add_option('--spill-results',
+                         dest='spill_results',
+                         action='store_true',
+                         default=False,
+                         help="Store the details of test results in a "
+                              "temporary file instead of in memory")
+        group.add_option('--drop-pass-details',
+                         dest='drop_pass_details',
+                         action='store_true',
+                         default=False,
+                         help="Drop the details of passed steps once they "
+                              "have been counted")
+        group.add_option('--parallel',
+                         dest='parallel',
+                         type='int',
+                         default=1,
+                         metavar='N',
+                         help="Run the tests in N application instances in "
+                              "parallel, each with its own profile "
+                              "(default: %default)")
+        group.add_option('--profile-cache',
+                         dest='profile_cache',
+                         default=profiles.DEFAULT_CACHE_DIR,
+                         metavar='PATH',
+                         help="Directory of the cached profile templates "
+                              "(default: %default)")
+        group.add_option('--no-profile-cache',
+                         dest='profile_cache',
+                         action='store_const',
+                         const=None,
+                         help="Create profiles without cached templates")
+        group.add_option('--history',
+                         dest='history',
+                         default=None,
+                         metavar='PATH',
+                         help="File to store the durations and results of "
+                              "the tests in, which are used to schedule and "
+                              "select the tests of later runs")
+        group.add_option('--order',
+                         dest='order',
+                         choices=('manifest', 'longest-first'),
+                         default='manifest',
+                         help="Order to run the tests in: as listed in the "
+                              "manifest, or longest-first by the durations "
+                              "of previous runs (default: %default)")
+        group.add_option('--last-failed',
+                         dest='last_failed',
+                         action='store_true',
+                         default=False,
+                         help="Only run the tests which failed in the last "
+                              "run")
+        group.add_option('--changed-since-last-run',
+                         dest='changed',
+                         action='store_true',
+                         default=False,
+                         help="Only run the tests which have changed since "
+                              "the last run, including the modules they "
+                              "require")
+        group.add_option('--pool',
+                         dest='pool',
+                         default=None,
+                         metavar='[HOST:]PORT',
+                         help="Lease already started application instances "
+                              "from the mozmill-pool daemon at the given "
+                              "address instead of starting them")
 
         if self.handlers:
             group.add_option('--disable',
@@ -892,31 +1393,9 @@ class CLI(mozrunner.CLI):
         profile_args = mozrunner.CLI.profile_args(self)
         profile_args.setdefault('addons', []).extend(ADDONS)
 
-        # create a preferences dict whose entries will be added later
-        prefs = {
-            # Bug 695026 - Re-enable e10s when fully supported
-            'browser.displayedE10SPrompt': 5,
-            'browser.tabs.remote.autostart': False,
-
-            'browser.newtab.preload': False,
-            'browser.newtabpage.introShown': True,
-            'browser.uitour.enabled': False,
-            'extensions.jsbridge.port': self.jsbridge_port,
-            'focusmanager.testmode': True
-        }
-
-        # Bug 1081996: Separate fixes for each e10s testing duration
-        for i in range(1, 10):
-            prefs['browser.tabs.remote.autostart.%s' % i] = False
-            prefs['browser.displayedE10SPrompt.%s' % i] = 5
-
-        if self.options.debug:
-            prefs['extensions.checkCompatibility'] = False
-            prefs['extensions.jsbridge.log'] = True
-            prefs['javascript.options.strict'] = True
-
-        # add the preferences of this function to the existing ones
-        profile_args.setdefault('preferences', []).extend(prefs.items());
+        # add the preferences of mozmill to the existing ones
+        prefs = cli_preferences(self.jsbridge_port, debug=self.options.debug)
+        profile_args.setdefault('preferences', []).extend(prefs.items())
 
         return profile_args
 
@@ -936,15 +1415,32 @@ class CLI(mozrunner.CLI):
         if (not self.manifest.tests) and (not self.options.manual):
             self.parser.error("No tests found. Please specify with -t or -m")
 
+        tests = self.manifest.active_tests(**mozinfo.info)
+        if self.options.last_failed or self.options.changed:
+            tests = self.select_tests(tests)
+            if not tests and not self.options.manual:
+                print 'No failed or changed tests to run'
+                return
+
+        tests = self.schedule_tests(tests)
+        if self.options.parallel > 1 and not self.options.manual:
+            return self.run_parallel(tests)
+
         # create a Mozrunner
-        runner = self.create_runner()
+        runner = self.get_runner()
 
         # create an instance of MozMill
         mozmill = MozMill(runner, self.jsbridge_port,
                           jsbridge_timeout=self.options.timeout,
+                          jsbridge_reverse=not self.options.pool,
                           handlers=self.event_handlers,
                           screenshots_path=self.options.screenshots_path,
-                          server_root=self.options.server_root)
+                          server_root=self.options.server_root,
+                          results=self.create_results(),
+                          handler_workers=self.options.handler_workers,
+                          screenshots_format=self.options.screenshots_format,
+                          screenshots_quality=self.options.screenshots_quality,
+                          server_cache=self.options.server_cache)
 
         # set debugger arguments
         mozmill.set_debugger(*self.debugger_arguments())
@@ -961,14 +1457,14 @@ class CLI(mozrunner.CLI):
 
         # run the tests
         exception = None
-        tests = self.manifest.active_tests(**mozinfo.info)
         try:
-            mozmill.run(tests, self.options.restart)
+            mozmill.run(tests, isolation=self.options.isolation)
         except:
             exception_type, exception, tb = sys.exc_info()
 
         # do whatever reporting you're going to do
         results = mozmill.finish(fatal=exception is not None)
+        results.close()
 
         # exit on bad stuff happen
         if exception:
@@ -979,10 +1475,245 @@ class CLI(mozrunner.CLI):
         # return results on success [currently unused]
         return results
 
+    def create_runner(self):
+        """Create a runner, with the profile cloned from a cached template."""
+        profile = profiles.create_profile(self.profile_class,
+                                          self.profile_args(),
+                                          self.options.profile_cache)
+        return self.runner_class(profile=profile, **self.runner_args())
+
+    def get_runner(self):
+        """Create a runner, or lease one from the pool daemon if given."""
+        if not self.options.pool:
+            return self.create_runner()
+
+        runner = pool.PooledRunner(pool.parse_address(self.options.pool),
+                                   timeout=self.options.timeout)
+        self.jsbridge_port = runner.jsbridge_port
+
+        return runner
+
+    def create_results(self):
+        """Create the TestResults with the configured storage policy."""
+        return TestResults(spill=self.options.spill_results,
+                           keep_passes=not self.options.drop_pass_details)
+
+    def select_tests(self, tests):
+        """Returns the failed or changed tests, as requested."""
+        return self.history.select(tests, failed=self.options.last_failed,
+                                   changed=self.options.changed)
+
+    def schedule_tests(self, tests):
+        """Returns the tests in the order they have to be run."""
+        if self.options.order == 'longest-first':
+            return self.history.sort(tests)
+        return tests
+
+    def shard_tests(self, tests, count):
+        """Split the tests into the given number of lists.
+
+        With a test history the lists are balanced by the durations of
+        the tests in previous runs.
+
+        """
+        if self.history:
+            return self.history.balance(tests, count)
+        return [tests[i::count] for i in range(count)]
+
+    def run_parallel(self, tests):
+        """Run the tests sharded across several application instances.
+
+        Each instance gets its own profile, jsbridge port, and http server.
+        The event handlers are shared by all instances, and get stopped
+        once with the merged results.
+
+        """
+        count = max(1, min(self.options.parallel, len(tests)))
+
+        workers = []
+        for shard in self.shard_tests(tests, count):
+            # the jsbridge port gets set in the profile by create_runner()
+            self.jsbridge_port = jsbridge.find_port()
+            runner = self.get_runner()
+
+            handlers = [SharedHandler(handler)
+                        for handler in self.event_handlers]
+            mozmill = MozMill(runner, self.jsbridge_port,
+                              jsbridge_timeout=self.options.timeout,
+                              jsbridge_reverse=not self.options.pool,
+                              handlers=handlers,
+                              screenshots_path=self.options.screenshots_path,
+                              server_root=self.options.server_root,
+                              results=self.create_results(),
+                              handler_workers=self.options.handler_workers,
+                              screenshots_format=self.options.screenshots_format,
+                              screenshots_quality=self.options.screenshots_quality,
+                              server_cache=self.options.server_cache)
+            mozmill.set_debugger(*self.debugger_arguments())
+
+            workers.append({'mozmill': mozmill, 'tests': shard,
+                            'exceptions': [], 'results': None})
+
+        def run(worker):
+            try:
+                worker['mozmill'].run(worker['tests'],
+                                      isolation=self.options.isolation)
+            except:
+                worker['exceptions'].append(sys.exc_info())
+            try:
+                worker['results'] = worker['mozmill'].finish(
+                    fatal=bool(worker['exceptions']))
+            except:
+                worker['exceptions'].append(sys.exc_info())
+
+        threads = [threading.Thread(target=run, args=(worker,))
+                   for worker in workers]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # join with a timeout so that we can still be interrupted
+            while thread.is_alive():
+                thread.join(1)
+
+        # merge the results and stop the handlers with them, a worker
+        # whose finish() failed has no results and only reports its errors
+        results = TestResults()
+        for worker in workers:
+            if worker['results'] is not None:
+                results.merge(worker['results'])
+
+        exceptions = [exception for worker in workers
+                      for exception in worker['exceptions']]
+        for handler in self.event_handlers:
+            if hasattr(handler, 'stop'):
+                handler.stop(results, bool(exceptions))
+            handler.mozmill = None
+
+        for worker in workers:
+            worker['mozmill'].results.close()
+
+        # exit on bad stuff happen
+        for exception_type, exception, tb in exceptions:
+            traceback.print_exception(exception_type, exception, tb)
+        if exceptions or results.fails:
+            sys.exit(1)
+
+        return results
+
+
+class PoolCLI(mozrunner.CLI):
+    """Command line interface to the application pool daemon.
+
+    It only takes the options to create the applications. Tests, reports
+    and event handlers are up to the mozmill runs leasing them.
+
+    """
+
+    module = "mozmill"
+
+    def __init__(self, args):
+        # Update environmental settings for command line usage
+        os.environ.update(ENVIRONMENT)
+
+        # the jsbridge port gets chosen for each application
+        self.jsbridge_port = None
+
+        mozrunner.CLI.__init__(self, args)
+
+        if self.options.pool_size < 1:
+            self.parser.error("The size of the pool has to be at least 1")
+
+    def add_options(self, parser):
+        mozrunner.CLI.add_options(self, parser)
+
+        group = OptionGroup(parser, 'Pool options')
+        group.add_option('--size',
+                         dest='pool_size',
+                         type='int',
+                         default=2,
+                         metavar='N',
+                         help="Number of application instances to keep "
+                              "started (default: %default)")
+        group.add_option('--port',
+                         dest='pool_port',
+                         type='int',
+                         default=pool.DEFAULT_PORT,
+                         help="Port to serve the pool on (default: %default)")
+        group.add_option("--timeout",
+                         dest="timeout",
+                         type="float",
+                         default=JSBRIDGE_TIMEOUT,
+                         help="Seconds to wait for jsbridge of a started "
+                              "application (default: %default)")
+        group.add_option('--profile-cache',
+                         dest='profile_cache',
+                         default=profiles.DEFAULT_CACHE_DIR,
+                         metavar='PATH',
+                         help="Directory of the cached profile templates "
+                              "(default: %default)")
+        group.add_option('--no-profile-cache',
+                         dest='profile_cache',
+                         action='store_const',
+                         const=None,
+                         help="Create profiles without cached templates")
+        group.add_option('-D', '--debug', dest="debug",
+                         action="store_true",
+                         default=False,
+                         help="debug mode"
+                         )
+        parser.add_option_group(group)
+
+    def profile_args(self):
+        profile_args = mozrunner.CLI.profile_args(self)
+        profile_args.setdefault('addons', []).extend(ADDONS)
+
+        # the pool connects to the applications on its own
+        prefs = cli_preferences(self.jsbridge_port, reverse=False,
+                                debug=self.options.debug)
+        profile_args.setdefault('preferences', []).extend(prefs.items())
+
+        return profile_args
+
+    def create_runner(self):
+        """Create a runner, with the profile cloned from a cached template."""
+        profile = profiles.create_profile(self.profile_class,
+                                          self.profile_args(),
+                                          self.options.profile_cache)
+        return self.runner_class(profile=profile, **self.runner_args())
+
+    def create_application(self):
+        # the jsbridge port gets set in the profile by create_runner()
+        self.jsbridge_port = jsbridge.find_port()
+        return pool.PooledApplication(self.create_runner(), self.jsbridge_port,
+                                      timeout=self.options.timeout)
+
+    def run(self):
+        """CLI front end to run the pool daemon."""
+        browser_pool = pool.BrowserPool(self.create_application,
+                                        size=self.options.pool_size)
+        server = pool.PoolServer(('127.0.0.1', self.options.pool_port),
+                                 browser_pool)
+
+        print 'Serving %d application instances on port %d' % \
+            (self.options.pool_size, self.options.pool_port)
+        try:
+            browser_pool.start()
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            browser_pool.close()
+
 
 def cli(args=sys.argv[1:]):
     CLI(args).run()
 
 
+def pool_cli(args=sys.argv[1:]):
+    PoolCLI(args).run()
+
+
 if __name__ == '__main__':
     cli()
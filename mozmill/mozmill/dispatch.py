@@ -0,0 +1,134 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Pool of worker threads to run event handlers on.
+
+Events arrive on the thread which reads the jsbridge sockets. Handlers which
+do I/O would stall the reading, and cause timeouts of the bridge. So their
+calls get queued instead, and are run by the workers of a Dispatcher.
+
+"""
+
+import Queue
+import threading
+import time
+import traceback
+
+
+class Dispatcher(object):
+    """Runs calls on a pool of worker threads.
+
+    Calls with the same key are always run by the same worker, in the order
+    they have been dispatched. Each worker has a bounded queue, and dispatch()
+    blocks while the queue is full, until the worker has caught up. Those
+    waits are counted as backpressure in the statistics.
+
+    """
+
+    def __init__(self, workers=2, queue_size=1000):
+        """Constructor of the Dispatcher class.
+
+        Keyword arguments:
+        workers -- Number of worker threads
+        queue_size -- Maximum number of pending calls per worker
+
+        """
+        self.queues = [Queue.Queue(queue_size) for i in range(workers)]
+        self.lanes = {}
+
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+        # statistics
+        self.pending = 0
+        self.max_pending = 0
+        self.dispatched = 0
+        self.handled = 0
+        self.errors = 0
+        self.blocked = 0
+
+        self.threads = []
+        for queue in self.queues:
+            thread = threading.Thread(target=self.run, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def dispatch(self, key, func, *args):
+        """Queue a call of func with args on the worker for key."""
+        with self.lock:
+            if key not in self.lanes:
+                self.lanes[key] = len(self.lanes) % len(self.queues)
+            queue = self.queues[self.lanes[key]]
+
+            self.pending += 1
+            self.dispatched += 1
+            self.max_pending = max(self.max_pending, self.pending)
+
+        try:
+            queue.put_nowait((func, args))
+        except Queue.Full:
+            with self.lock:
+                self.blocked += 1
+            queue.put((func, args))
+
+    def run(self, queue):
+        while True:
+            call = queue.get()
+            if call is None:
+                break
+
+            func, args = call
+            try:
+                func(*args)
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+                traceback.print_exc()
+
+            with self.lock:
+                self.pending -= 1
+                self.handled += 1
+                if not self.pending:
+                    self.idle.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until all dispatched calls have been run.
+
+        Returns False if calls are still pending after the timeout.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.idle:
+            while self.pending:
+                if deadline is None:
+                    self.idle.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.idle.wait(remaining)
+
+            return not self.pending
+
+    def stats(self):
+        """Returns the statistics of the dispatched calls."""
+        with self.lock:
+            return {'dispatched': self.dispatched,
+                    'handled': self.handled,
+                    'errors': self.errors,
+                    'pending': self.pending,
+                    'max_pending': self.max_pending,
+                    'blocked': self.blocked}
+
+    def close(self):
+        """Run all pending calls and stop the workers."""
+        self.join()
+
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
@@ -6,3 +6,8 @@
 class ShutdownError(Exception):
     """Error raised when an application shutdown was not successful"""
     pass
+
+
+class PoolError(Exception):
+    """Error raised when an application pool request was not successful"""
+    pass
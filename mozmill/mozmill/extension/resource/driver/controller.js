@@ -308,15 +308,18 @@ MozMillController.prototype.open = function mc_open(url) {
  * @param {Element} node
  *        The window or DOM element to capture
  * @param {String} name
- *        The name of the screenshot used in reporting and as filename
+ *        The name of the screenshot used in reporting
  * @param {Boolean} save
- *        If true saves the screenshot as 'name.jpg' in tempdir,
- *        otherwise returns a dataURL
+ *        If true saves the screenshot to the screenshots folder, named by
+ *        the hash of its content, otherwise returns a dataURL
  * @param {Element[]} highlights
  *        A list of DOM elements to highlight by drawing a red rectangle around them
  *
  * @returns {Object} Object which contains properties like filename, dataURL,
- *          name and timestamp of the screenshot
+ *          name and timestamp of the screenshot. Saved screenshots have no
+ *          dataURL. The file is written asynchronously, so the filename and
+ *          hash get set, and the "screenshot" event is sent, only once the
+ *          file has been written.
  */
 MozMillController.prototype.screenshot = function mc_screenshot(node, name, save, highlights) {
   if (!node) {
@@ -336,31 +339,31 @@ MozMillController.prototype.screenshot = function mc_screenshot(node, name, save
     }
   }
 
-  // If save is false, a dataURL is used
-  // Include both in the report anyway to avoid confusion and make the report easier to parse
   var screenshot = {"filename": undefined,
-                    "dataURL": utils.takeScreenshot(node, highlights),
                     "name": name,
                     "timestamp": new Date().toLocaleString()};
 
+  // If save is false, a dataURL is used
   if (!save) {
+    screenshot.dataURL = utils.takeScreenshot(node, highlights);
     return screenshot;
   }
 
-  // Save the screenshot to disk
+  // Save the screenshot to disk in the background
+  utils.saveScreenshot(node, highlights, function (aResult) {
+    screenshot.filename = aResult.filename;
+    screenshot.hash = aResult.hash;
+    screenshot.failure = aResult.failure;
 
-  let {filename, failure} = utils.saveDataURL(screenshot.dataURL, name);
-  screenshot.filename = filename;
-  screenshot.failure = failure;
-
-  if (failure) {
-    broker.log({'function': 'controller.screenshot()',
-                'message': 'Error writing to file: ' + screenshot.filename});
-  } else {
-    // Send the screenshot object to python over jsbridge
-    broker.sendMessage("screenshot", screenshot);
-    broker.pass({'function': 'controller.screenshot()'});
-  }
+    if (aResult.failure) {
+      broker.log({'function': 'controller.screenshot()',
+                  'message': 'Error writing to file: ' + screenshot.filename});
+    } else {
+      // Send the screenshot object to python over jsbridge
+      broker.sendMessage("screenshot", screenshot);
+      broker.pass({'function': 'controller.screenshot()'});
+    }
+  });
 
   return screenshot;
 }
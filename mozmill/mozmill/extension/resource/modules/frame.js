@@ -3,7 +3,8 @@
  * file, you can obtain one at http://mozilla.org/MPL/2.0/. */
 
 var EXPORTED_SYMBOLS = ['Collector','Runner','events', 'runTestFile', 'log',
-                        'timers', 'persisted', 'shutdownApplication'];
+                        'timers', 'persisted', 'shutdownApplication',
+                        'resetApplication'];
 
 const Cc = Components.classes;
 const Ci = Components.interfaces;
@@ -34,8 +35,21 @@ var mozmill = undefined;
 var mozelement = undefined;
 var modules = undefined;
 
+// Paths of the modules required by each loaded module
+var dependencies = {};
+
+// Modification times of the loaded local modules, to reload changed ones
+var moduleTimes = {};
+
+// Loaders for the modules required by a test file, per directory of the
+// tests, which cache the resolved module paths until invalidateModules()
+var loaders = {};
+
 var timers = [];
 
+// Types of the main window of the supported applications
+var MAIN_WINDOW_TYPES = ["navigator:browser", "mail:3pane"];
+
 
 /**
  * Shutdown or restart the application
@@ -62,14 +76,161 @@ function shutdownApplication(aFlags) {
 
   // Use a timer to trigger the application restart, which will allow us to
   // send an ACK packet via jsbridge if the method has been called via Python.
+  // Also wait until all pending events have been sent to Python.
   var event = {
     notify: function event_notify(timer) {
-      Services.startup.quit(flags);
+      var quit = function () {
+        Services.startup.quit(flags);
+      };
+
+      if (typeof(Events) != "undefined") {
+        Events.whenSent(quit);
+      } else {
+        quit();
+      }
     }
   }
 
   var timer = Cc["@mozilla.org/timer;1"].createInstance(Ci.nsITimer);
-  timer.initWithCallback(event, 100, Ci.nsITimer.TYPE_ONE_SHOT);
+  timer.initWithCallback(event, 0, Ci.nsITimer.TYPE_ONE_SHOT);
+}
+
+/**
+ * Returns the user set preferences with their types and values
+ */
+function getUserPreferences() {
+  var preferences = {};
+
+  Services.prefs.getChildList("", {}).forEach(function (aName) {
+    if (!Services.prefs.prefHasUserValue(aName)) {
+      return;
+    }
+
+    var type = Services.prefs.getPrefType(aName);
+    switch (type) {
+      case Ci.nsIPrefBranch.PREF_BOOL:
+        preferences[aName] = {type: type,
+                              value: Services.prefs.getBoolPref(aName)};
+        break;
+      case Ci.nsIPrefBranch.PREF_INT:
+        preferences[aName] = {type: type,
+                              value: Services.prefs.getIntPref(aName)};
+        break;
+      case Ci.nsIPrefBranch.PREF_STRING:
+        preferences[aName] = {type: type,
+                              value: Services.prefs.getCharPref(aName)};
+        break;
+    }
+  });
+
+  return preferences;
+}
+
+// Snapshot of the preferences when the application has been started, which
+// gets restored by resetApplication()
+var startupPreferences = getUserPreferences();
+
+/**
+ * Restore the preferences of the snapshot taken at startup
+ */
+function restorePreferences() {
+  var current = getUserPreferences();
+
+  for (var name in current) {
+    if (!(name in startupPreferences)) {
+      Services.prefs.clearUserPref(name);
+    }
+  }
+
+  for (var name in startupPreferences) {
+    var pref = startupPreferences[name];
+    if (name in current && current[name].type === pref.type &&
+        current[name].value === pref.value) {
+      continue;
+    }
+
+    if (name in current && current[name].type !== pref.type) {
+      Services.prefs.clearUserPref(name);
+    }
+
+    switch (pref.type) {
+      case Ci.nsIPrefBranch.PREF_BOOL:
+        Services.prefs.setBoolPref(name, pref.value);
+        break;
+      case Ci.nsIPrefBranch.PREF_INT:
+        Services.prefs.setIntPref(name, pref.value);
+        break;
+      case Ci.nsIPrefBranch.PREF_STRING:
+        Services.prefs.setCharPref(name, pref.value);
+        break;
+    }
+  }
+}
+
+/**
+ * Close all windows but the main window, and all its tabs but one
+ */
+function closeWindows() {
+  var mainWindow = null;
+  var windows = [];
+
+  var enumerator = Services.wm.getEnumerator("");
+  while (enumerator.hasMoreElements()) {
+    var win = enumerator.getNext();
+    var type = win.document.documentElement.getAttribute("windowtype");
+
+    if (!mainWindow && MAIN_WINDOW_TYPES.indexOf(type) !== -1) {
+      mainWindow = win;
+    } else {
+      windows.push(win);
+    }
+  }
+
+  if (!mainWindow) {
+    throw new Error("No main window found to reset the application");
+  }
+
+  windows.forEach(function (aWindow) {
+    aWindow.close();
+  });
+
+  var browser = utils.getBrowserObject(mainWindow);
+  if (browser && browser.removeAllTabsBut) {
+    browser.removeAllTabsBut(browser.selectedTab);
+    browser.loadURI("about:blank");
+  }
+}
+
+/**
+ * Remove all cookies and clear the network cache
+ */
+function clearCaches() {
+  Services.cookies.removeAll();
+
+  if ("nsICacheStorageService" in Ci) {
+    Cc["@mozilla.org/netwerk/cache-storage-service;1"].
+    getService(Ci.nsICacheStorageService).clear();
+  } else {
+    Services.cache.evictEntries(Ci.nsICache.STORE_ANYWHERE);
+  }
+}
+
+/**
+ * Restore the initial state of the application without restarting it
+ *
+ * Closes additional windows and tabs, restores the preferences of the
+ * snapshot taken at startup, clears cookies and caches, and replaces the
+ * persisted data.
+ *
+ * @param {object} [aPersisted={}]
+ *        Persisted data for the next test
+ */
+function resetApplication(aPersisted) {
+  closeWindows();
+  restorePreferences();
+  clearCaches();
+
+  persisted = aPersisted || {};
 }
 
 function stateChangeBase(possibilties, restrictions, target, cmeta, v) {
@@ -189,6 +350,12 @@ events.endTest = function events_endTest(test) {
   if (!test || test.status === 'done')
     return;
 
+  // screenshots of the test are still reported for it
+  if (!utils.waitForScreenshots()) {
+    events.fail({'exception': new Error("Timeout waiting for screenshots " +
+                                        "to be saved")});
+  }
+
   // report the end of a test
   test.__end__ = Date.now();
   test.status = 'done';
@@ -238,6 +405,7 @@ events.endModule = function events_endModule(aModule) {
 
   var obj = {
     'filename': aModule.__file__,
+    'dependencies': getDependencies(aModule),
     'time_start': aModule.__start__,
     'time_end': aModule.__end__
   }
@@ -245,6 +413,90 @@ events.endModule = function events_endModule(aModule) {
   events.fireEvent('endModule', obj);
 }
 
+/**
+ * Returns the modification time of a local module, or null for others
+ */
+function getModificationTime(aSpec) {
+  try {
+    var uri = Services.io.newURI(aSpec, null, null);
+    if (uri instanceof Ci.nsIFileURL) {
+      return uri.file.lastModifiedTime;
+    }
+  } catch (e) {
+    // not a local module, or it has been removed
+  }
+
+  return null;
+}
+
+/**
+ * Remove the modules which have been modified since they were loaded from
+ * the cache, together with all modules requiring them. The loaders are
+ * dropped as well, so module paths get resolved again for each test file,
+ * and modules which have been added or removed are picked up.
+ */
+function invalidateModules() {
+  loaders = {};
+
+  if (modules === undefined) {
+    return;
+  }
+
+  var changed = [];
+  for (var spec in moduleTimes) {
+    if (getModificationTime(spec) !== moduleTimes[spec]) {
+      changed.push(spec);
+    }
+  }
+
+  while (changed.length) {
+    var spec = changed.shift();
+    if (!(spec in modules)) {
+      continue;
+    }
+
+    delete modules[spec];
+    delete moduleTimes[spec];
+    delete dependencies[spec];
+
+    for (var other in dependencies) {
+      if (dependencies[other].indexOf(spec) !== -1) {
+        changed.push(other);
+      }
+    }
+  }
+}
+
+/**
+ * Returns the local paths of all modules a test module requires, directly
+ * or via other modules. Modules of mozmill itself are not included.
+ */
+function getDependencies(aModule) {
+  var queue = (aModule.__requires__ || []).slice();
+  var seen = {};
+  var paths = [];
+
+  while (queue.length) {
+    var spec = queue.shift();
+    if (spec in seen) {
+      continue;
+    }
+    seen[spec] = true;
+    queue.push.apply(queue, dependencies[spec] || []);
+
+    try {
+      var uri = Services.io.newURI(spec, null, null);
+      if (uri instanceof Ci.nsIFileURL) {
+        paths.push(uri.file.path);
+      }
+    } catch (e) {
+      // not a local module
+    }
+  }
+
+  return paths;
+}
+
 events.pass = function events_pass(obj) {
   // a low level event, such as a keystroke, succeeds
   if (events.currentTest) {
@@ -495,14 +747,6 @@ Collector.prototype.initTestModule = function collector_initTestModule(filename,
 
 Collector.prototype.loadFile = function collector_loadFile(path, collector) {
   var self = this;
-  var moduleLoader = new securableModule.Loader({
-    rootPaths: ["resource://mozmill/modules/"],
-    defaultPrincipal: "system",
-    globals : { Cc: Cc,
-                Ci: Ci,
-                Cu: Cu,
-                Cr: Components.results}
-  });
 
   // load a test module from a file and add some candy
   var file = Cc["@mozilla.org/file/local;1"].createInstance(Ci.nsILocalFile);
@@ -511,6 +755,9 @@ Collector.prototype.loadFile = function collector_loadFile(path, collector) {
 
   this.loadTestResources();
 
+  // required modules are kept for the session unless they have changed
+  invalidateModules();
+
   var systemPrincipal = Services.scriptSecurityManager.getSystemPrincipal();
   var module = new Components.utils.Sandbox(systemPrincipal);
   module.assert = assert;
@@ -528,23 +775,33 @@ Collector.prototype.loadFile = function collector_loadFile(path, collector) {
   module.mozmill = mozmill;
   module.persisted = persisted;
 
+  // Paths of the modules required directly by the test module
+  var requires = [];
+
   module.require = function loadModule(mod) {
-    var loader = new securableModule.Loader({
-      rootPaths: [Services.io.newFileURI(file.parent).spec,
-                  "resource://mozmill/modules/"],
-      defaultPrincipal: "system",
-      globals : { assert: assert,
-                  baseurl: self.baseurl,
-                  expect: expect,
-                  mozmill: mozmill,
-                  elementslib: mozelement,      // This a quick hack to maintain backwards compatibility with 1.5.x
-                  findElement: mozelement,
-                  persisted: persisted,
-                  Cc: Cc,
-                  Ci: Ci,
-                  Cu: Cu,
-                  log: log }
-    });
+    // reuse the loader of the directory, which caches resolved paths
+    var root = Services.io.newFileURI(file.parent).spec;
+    if (!(root in loaders)) {
+      loaders[root] = new securableModule.Loader({
+        dependencies: dependencies,
+        rootPaths: [root, "resource://mozmill/modules/"],
+        defaultPrincipal: "system"
+      });
+    }
+
+    var loader = loaders[root];
+    loader.required = [];
+    loader.globals = { assert: assert,
+                       baseurl: self.baseurl,
+                       expect: expect,
+                       mozmill: mozmill,
+                       elementslib: mozelement,      // This a quick hack to maintain backwards compatibility with 1.5.x
+                       findElement: mozelement,
+                       persisted: persisted,
+                       Cc: Cc,
+                       Ci: Ci,
+                       Cu: Cu,
+                       log: log };
 
     if (modules != undefined) {
       loader.modules = modules;
@@ -553,6 +810,22 @@ Collector.prototype.loadFile = function collector_loadFile(path, collector) {
     var retval = loader.require(mod);
     modules = loader.modules;
 
+    // remember when newly loaded modules have been modified
+    for (var spec in modules) {
+      if (!(spec in moduleTimes)) {
+        var time = getModificationTime(spec);
+        if (time !== null) {
+          moduleTimes[spec] = time;
+        }
+      }
+    }
+
+    loader.required.forEach(function (aPath) {
+      if (requires.indexOf(aPath) === -1) {
+        requires.push(aPath);
+      }
+    });
+
     return retval;
   }
 
@@ -581,6 +854,7 @@ Collector.prototype.loadFile = function collector_loadFile(path, collector) {
   }
 
   module.__file__ = path;
+  module.__requires__ = requires;
   module.__uri__ = uri;
 
   return module;
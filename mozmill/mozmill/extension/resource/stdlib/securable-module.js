@@ -180,6 +180,8 @@
        );
      if (options.modules === undefined)
        options.modules = {};
+     if (options.dependencies === undefined)
+       options.dependencies = {};
      if (options.globals === undefined)
        options.globals = {};
 
@@ -188,6 +190,11 @@
      this.sandboxes = {};
      this.modules = options.modules;
      this.globals = options.globals;
+
+     // Paths of the modules required by each module, and of the modules
+     // required directly via this loader
+     this.dependencies = options.dependencies;
+     this.required = [];
    };
 
    exports.Loader.prototype = {
@@ -207,6 +214,14 @@
          var path = self.fs.resolveModule(rootDir, module);
          if (!path)
            throw new Error('Module "' + module + '" not found');
+         var required = self.required;
+         if (rootDir) {
+           if (!(rootDir in self.dependencies))
+             self.dependencies[rootDir] = [];
+           required = self.dependencies[rootDir];
+         }
+         if (required.indexOf(path) == -1)
+           required.push(path);
          if (!(path in self.modules)) {
            var options = self.fs.getFile(path);
            if (options.filename === undefined)
@@ -267,15 +282,23 @@
    exports.CompositeFileSystem = function CompositeFileSystem(fses) {
      this.fses = fses;
      this._pathMap = {};
+     this._resolved = {};
    };
 
    exports.CompositeFileSystem.prototype = {
      resolveModule: function resolveModule(base, path) {
+       // Resolving checks for the existence of the file, so remember
+       // where modules have been found
+       var key = base + "\n" + path;
+       if (key in this._resolved)
+         return this._resolved[key];
+
        for (var i = 0; i < this.fses.length; i++) {
          var fs = this.fses[i];
          var absPath = fs.resolveModule(base, path);
          if (absPath) {
            this._pathMap[absPath] = fs;
+           this._resolved[key] = absPath;
            return absPath;
          }
        }
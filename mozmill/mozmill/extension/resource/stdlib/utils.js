@@ -16,13 +16,15 @@ var EXPORTED_SYMBOLS = ["applicationName",
                         "logDeprecated",
                         "logDeprecatedAssert",
                         "saveDataURL",
+                        "saveScreenshot",
                         "setPreference",
                         "sleep",
                         "startTimer",
                         "stopTimer",
                         "takeScreenshot",
                         "unwrapNode",
-                        "waitFor"
+                        "waitFor",
+                        "waitForScreenshots"
                        ];
 
 const Cc = Components.classes;
@@ -31,6 +33,7 @@ const Cu = Components.utils;
 
 
 Cu.import("resource://gre/modules/NetUtil.jsm");
+Cu.import("resource://gre/modules/osfile.jsm");
 Cu.import("resource://gre/modules/Services.jsm");
 
 const applicationIdMap = {
@@ -49,6 +52,21 @@ var hwindow = Services.appShell.hiddenDOMWindow;
 
 var uuidgen = Cc["@mozilla.org/uuid-generator;1"].getService(Ci.nsIUUIDGenerator);
 
+// Image formats screenshots can be stored in
+const SCREENSHOT_FORMATS = {
+  "jpeg": {mimeType: "image/jpeg", extension: "jpg", quality: 0.5},
+  "png": {mimeType: "image/png", extension: "png"}
+};
+
+// Maximum time to wait for the screenshots to be written (ms)
+const SCREENSHOT_TIMEOUT = 30000;
+
+// Number of screenshots which are still encoded or written
+var pendingScreenshots = 0;
+
+// Writes of screenshots in progress by their path
+var screenshotWrites = {};
+
 function Copy (obj) {
   for (var n in obj) {
     this[n] = obj[n];
@@ -338,9 +356,43 @@ function getChromeOffset(elem) {
 }
 
 /**
- * Takes a screenshot of the specified DOM node
+ * Returns the format and quality to store screenshots with, as set in the
+ * persisted screenshots settings
  */
-function takeScreenshot(node, highlights) {
+function getScreenshotPolicy() {
+  var frame = {}; Cu.import('resource://mozmill/modules/frame.js', frame);
+  var settings = frame.persisted['screenshots'] || {};
+
+  var format = SCREENSHOT_FORMATS[settings['format']] || SCREENSHOT_FORMATS["jpeg"];
+
+  return {path: settings['path'],
+          mimeType: format.mimeType,
+          extension: format.extension,
+          quality: settings['quality'] || format.quality};
+}
+
+/**
+ * Returns the hex encoded SHA-1 hash of the given bytes
+ */
+function getHash(aBytes) {
+  var hasher = Cc["@mozilla.org/security/hash;1"]
+               .createInstance(Ci.nsICryptoHash);
+  hasher.init(hasher.SHA1);
+  hasher.update(aBytes, aBytes.length);
+
+  var digest = hasher.finish(false);
+  var hex = "";
+  for (var i = 0; i < digest.length; i++) {
+    hex += ("0" + digest.charCodeAt(i).toString(16)).slice(-2);
+  }
+
+  return hex;
+}
+
+/**
+ * Draws the specified DOM node onto a canvas
+ */
+function drawScreenshot(node, highlights) {
   var rect, win, width, height, left, top, needsOffset;
   // node can be either a window or an arbitrary DOM node
   try {
@@ -398,7 +450,117 @@ function takeScreenshot(node, highlights) {
     }
   }
 
-  return canvas.toDataURL("image/jpeg", 0.5);
+  return canvas;
+}
+
+/**
+ * Takes a screenshot of the specified DOM node
+ *
+ * @returns {String} The dataURL of the screenshot
+ */
+function takeScreenshot(node, highlights) {
+  var policy = getScreenshotPolicy();
+
+  return drawScreenshot(node, highlights).toDataURL(policy.mimeType,
+                                                    policy.quality);
+}
+
+/**
+ * Save a screenshot of the specified DOM node to the screenshots folder.
+ *
+ * The image is encoded to a binary blob off the main thread, and written
+ * asynchronously, so the test can go on in the meantime. The file is named
+ * by the hash of its content, so identical screenshots are stored only once.
+ *
+ * @param {Element} node
+ *        The window or DOM element to capture
+ * @param {Element[]} highlights
+ *        A list of DOM elements to highlight by drawing a red rectangle around them
+ * @param {Function} aCallback
+ *        Called with the hash containing the path of saved file, the hash
+ *        of its content, and the failure bit once the file has been written
+ */
+function saveScreenshot(node, highlights, aCallback) {
+  var policy = getScreenshotPolicy();
+  var canvas = drawScreenshot(node, highlights);
+
+  pendingScreenshots++;
+
+  function done(aFilename, aHash, aFailure) {
+    pendingScreenshots--;
+    aCallback({filename: aFilename, hash: aHash, failure: aFailure});
+  }
+
+  canvas.toBlob(function (aBlob) {
+    if (!aBlob) {
+      done(undefined, undefined, true);
+      return;
+    }
+
+    var reader = new hwindow.FileReader();
+    reader.onloadend = function () {
+      if (reader.error) {
+        done(undefined, undefined, true);
+        return;
+      }
+
+      var bytes = new Uint8Array(reader.result);
+      var hash = getHash(bytes);
+      var path = OS.Path.join(policy.path, hash + "." + policy.extension);
+
+      // Identical screenshots share the file, which might exist already
+      if (!(path in screenshotWrites)) {
+        screenshotWrites[path] = OS.File.writeAtomic(path, bytes, {
+          tmpPath: path + ".tmp",
+          noOverwrite: true
+        }).then(function () {
+          delete screenshotWrites[path];
+        }, function (aError) {
+          delete screenshotWrites[path];
+          if (!(aError instanceof OS.File.Error && aError.becauseExists)) {
+            throw aError;
+          }
+        });
+      }
+
+      screenshotWrites[path].then(function () {
+        done(path, hash, false);
+      }, function () {
+        done(path, hash, true);
+      });
+    };
+    reader.readAsArrayBuffer(aBlob);
+  }, policy.mimeType, policy.quality);
+}
+
+/**
+ * Wait until all screenshots have been saved
+ *
+ * @param {Number} [aTimeout]
+ *        Maximum time to wait in milliseconds
+ *
+ * @returns {Boolean} True if no screenshots are pending anymore
+ */
+function waitForScreenshots(aTimeout) {
+  var timeup = false;
+
+  var timer = hwindow.setTimeout(function () { timeup = true; },
+                                 aTimeout || SCREENSHOT_TIMEOUT);
+  var thread = Services.tm.currentThread;
+
+  while (pendingScreenshots > 0 && !timeup) {
+    thread.processNextEvent(true);
+
+    // If the application is going to shutdown, break out of the loop to not
+    // cause a hang
+    if (Services.startup.shuttingDown) {
+      break;
+    }
+  }
+
+  hwindow.clearTimeout(timer);
+
+  return pendingScreenshots === 0;
 }
 
 /**
@@ -0,0 +1,209 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""In-memory cache for the files served by the test HTTP server.
+
+The file_handler of wptserve reads each requested file from disk. Test pages
+with many resources get requested over and over again, so the files of the
+document root are preloaded into memory instead, and served from there with
+ETag and Last-Modified headers. Conditional requests of the application are
+answered with 304 Not Modified.
+
+A cached file is validated against the size and modification time of the
+file on each request, so changes on disk get picked up. Requests the cache
+can't answer, like ranges, pipes, or files with .headers files, are left to
+the file_handler of wptserve.
+
+"""
+
+from collections import OrderedDict
+import email.utils
+import hashlib
+import os
+import threading
+
+import wptserve.handlers
+
+
+MAX_FILE_SIZE = 1024 * 1024
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+
+# served by other handlers of wptserve
+EXCLUDED_EXTENSIONS = ('.asis', '.headers', '.py')
+
+
+class CacheEntry(object):
+    """A file held in memory, with the headers to serve it with."""
+
+    def __init__(self, path, data, stat, headers):
+        self.path = path
+        self.data = data
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+        self.etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        self.headers = headers + [('ETag', self.etag),
+                                  ('Last-Modified', self.last_modified)]
+
+    def is_current(self, stat):
+        """Returns whether the file on disk is still the cached one."""
+        return self.size == stat.st_size and self.mtime == stat.st_mtime
+
+    def not_modified(self, request):
+        """Returns whether the conditional request matches the entry."""
+        etags = request.headers.get('If-None-Match')
+        if etags is not None:
+            return etags.strip() == '*' or self.etag in [
+                etag.strip() for etag in etags.split(',')]
+
+        since = request.headers.get('If-Modified-Since')
+        if since is not None:
+            since = email.utils.parsedate_tz(since)
+            if since is not None:
+                return int(self.mtime) <= email.utils.mktime_tz(since)
+
+        return False
+
+
+class CachedFileHandler(wptserve.handlers.FileHandler):
+    """File handler for wptserve which serves the files from memory.
+
+    The least recently used files get dropped from the cache, when it
+    would grow beyond max_size.
+
+    """
+
+    def __init__(self, max_file_size=MAX_FILE_SIZE, max_size=MAX_CACHE_SIZE):
+        """Constructor of the CachedFileHandler class.
+
+        Keyword arguments:
+        max_file_size -- Maximum size of a file to cache in bytes
+        max_size -- Maximum size of all cached files in bytes
+
+        """
+        self.max_file_size = max_file_size
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.preloaded = set()
+        self.lock = threading.Lock()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, request, response):
+        entry = None
+        if self.is_cacheable(request):
+            entry = self.get_entry(request.filesystem_path)
+        if entry is None:
+            return wptserve.handlers.FileHandler.__call__(self, request,
+                                                          response)
+
+        response.headers.update(entry.headers)
+        if request.method in ('GET', 'HEAD') and entry.not_modified(request):
+            response.status = 304
+            response.content = ''
+        else:
+            response.content = entry.data
+
+        return response
+
+    def is_cacheable(self, request):
+        """Returns whether the request can be answered from the cache."""
+        if 'Range' in request.headers or 'pipe=' in request.url_parts.query:
+            return False
+
+        root, ext = os.path.splitext(request.filesystem_path)
+        return ext not in EXCLUDED_EXTENSIONS and not root.endswith('.sub')
+
+    def has_headers(self, path):
+        """Returns whether headers for the file are read from disk."""
+        directory = os.path.join(os.path.dirname(path), '__dir__')
+        return any(os.path.exists(filename + ext)
+                   for filename in (path, directory)
+                   for ext in ('.headers', '.sub.headers'))
+
+    def get_entry(self, path):
+        """Returns the cache entry of a file, loading it if necessary.
+
+        Returns None for files which don't exist or can't be cached.
+
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry.is_current(stat):
+                # mark as recently used
+                del self.entries[path]
+                self.entries[path] = entry
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+
+        return self.load(path, stat)
+
+    def load(self, path, stat):
+        if (not os.path.isfile(path) or stat.st_size > self.max_file_size or
+                self.has_headers(path)):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        entry = CacheEntry(path, data, stat, self.default_headers(path))
+
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.size -= len(old.data)
+
+            while self.entries and self.size + len(data) > self.max_size:
+                _, dropped = self.entries.popitem(last=False)
+                self.size -= len(dropped.data)
+
+            if self.size + len(data) <= self.max_size:
+                self.entries[path] = entry
+                self.size += len(data)
+
+        return entry
+
+    def preload(self, doc_root):
+        """Load the files of the document root into the cache.
+
+        Each document root gets only preloaded once. Later changes of the
+        files are still picked up when they get requested.
+
+        """
+        doc_root = os.path.abspath(doc_root)
+        if doc_root in self.preloaded:
+            return
+        self.preloaded.add(doc_root)
+
+        for root, dirs, files in os.walk(doc_root):
+            for filename in files:
+                if os.path.splitext(filename)[1] in EXCLUDED_EXTENSIONS:
+                    continue
+                self.get_entry(os.path.join(root, filename))
+
+                if self.size >= self.max_size:
+                    return
+
+    def stats(self):
+        """Returns the statistics of the cache."""
+        with self.lock:
+            return {'files': len(self.entries),
+                    'size': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses}
@@ -24,6 +24,16 @@ class EventHandler(object):
     def __call__(self, eventName, obj):
         """Handle global events."""
 
+    def accepts(self, eventName):
+        """Returns whether __call__ handles events of the given type.
+
+        Events no listener is interested in don't get decoded at all. The
+        answer is cached per event type, so it must not change while the
+        handler is in use.
+
+        """
+        return True
+
     def events(self):
         """Retrieve mapping of event typs.
 
@@ -0,0 +1,157 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""History of previous runs, used to schedule the tests.
+
+The durations of the test files are taken from the endModule events, and
+stored in a local JSON file once the run has finished. With them the tests
+can be ordered longest-first, or split into buckets of about the same
+duration for parallel runs. Tests without a known duration are estimated
+with the average of the known ones.
+
+For each test file the history also keeps whether it failed, and a hash of
+its contents together with the modules it required. That allows to select
+only the tests which failed or have changed since the last run.
+
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+class TestHistory(object):
+    """Results of the test files from previous runs.
+
+    It gets registered as event handler to record the results of the
+    current run, which are saved when the handlers get stopped.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tests = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.tests = dict(json.load(f)['tests'])
+        except (IOError, ValueError, KeyError, TypeError):
+            # no or unreadable history
+            self.tests = {}
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write aside and move in place, so no partial file gets read
+        fd, path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'tests': self.tests}, f)
+        try:
+            os.rename(path, self.path)
+        except OSError:
+            # the target can't be replaced on Windows
+            os.remove(self.path)
+            os.rename(path, self.path)
+
+    def checksum(self, path, dependencies):
+        """Returns the hash of a test file and the modules it requires."""
+        sha = hashlib.sha1()
+
+        for filename in [path] + sorted(dependencies):
+            sha.update(filename.encode('utf-8') + '\0')
+            try:
+                with open(filename, 'rb') as f:
+                    sha.update(f.read())
+            except IOError:
+                sha.update('\0')
+
+        return sha.hexdigest()
+
+    def events(self):
+        return {'mozmill.endModule': self.endModule}
+
+    def endModule(self, module):
+        entry = self.tests.setdefault(module['filename'], {})
+        entry['duration'] = module['time_end'] - module['time_start']
+
+        dependencies = module.get('dependencies') or []
+        entry['dependencies'] = dependencies
+        entry['hash'] = self.checksum(module['filename'], dependencies)
+
+    def stop(self, results, fatal=False):
+        if results is not None:
+            failed = {}
+            for test in results.alltests:
+                filename = test.get('filename')
+                failed[filename] = (failed.get(filename) or
+                                    bool(test.get('failed')))
+            for filename, value in failed.items():
+                self.tests.setdefault(filename, {})['failed'] = value
+
+        self.save()
+
+    def changed(self, test):
+        """Returns whether the test has changed since it was run last."""
+        entry = self.tests.get(test['path'])
+        if not entry or 'hash' not in entry:
+            return True
+        return entry['hash'] != self.checksum(test['path'],
+                                              entry.get('dependencies', []))
+
+    def failed(self, test):
+        """Returns whether the test failed when it was run last."""
+        return self.tests.get(test['path'], {}).get('failed', False)
+
+    def select(self, tests, failed=False, changed=False):
+        """Returns the tests which failed or have changed since the last run.
+
+        Keyword arguments:
+        failed -- Select the tests which failed in the last run
+        changed -- Select the tests which have changed, or were never run
+
+        """
+        return [test for test in tests
+                if (failed and self.failed(test)) or
+                   (changed and self.changed(test))]
+
+    def durations(self, tests):
+        """Returns the known or estimated durations of the given tests."""
+        known = [self.tests.get(test['path'], {}).get('duration')
+                 for test in tests]
+        measured = [duration for duration in known if duration is not None]
+        estimate = sum(measured) / len(measured) if measured else 0
+
+        return [estimate if duration is None else duration
+                for duration in known]
+
+    def sort(self, tests):
+        """Returns the tests ordered longest-first."""
+        durations = self.durations(tests)
+        order = sorted(range(len(tests)), key=lambda i: -durations[i])
+        return [tests[i] for i in order]
+
+    def balance(self, tests, count):
+        """Split the tests into count lists of about the same duration.
+
+        The longest tests are distributed first, each to the list with the
+        lowest total duration so far, or the fewest tests if equal. Each
+        list keeps the given order.
+
+        """
+        durations = self.durations(tests)
+        buckets = [[] for i in range(count)]
+        totals = [0] * count
+
+        for i in sorted(range(len(tests)), key=lambda i: -durations[i]):
+            bucket = min(range(count),
+                         key=lambda j: (totals[j], len(buckets[j])))
+            buckets[bucket].append(i)
+            totals[bucket] += durations[i]
+
+        return [[tests[i] for i in sorted(bucket)] for bucket in buckets]
@@ -8,11 +8,140 @@
 from datetime import datetime
 import json
 import logging
+import Queue
 import re
 import sys
+import threading
+import time
 import uuid
 
 
+def strip_key(obj, key):
+    """Returns a copy of obj without the given key in any of its dicts."""
+    if isinstance(obj, dict):
+        return dict([(k, strip_key(v, key)) for k, v in obj.items()
+                     if k != key])
+    if isinstance(obj, list):
+        return [strip_key(v, key) for v in obj]
+    return obj
+
+
+class EventMessage(object):
+    """Message for an event, which gets serialized only when logged.
+
+    The object of the event is kept as is, and serialized at most once for
+    each formatting which is requested by the log handlers.
+
+    """
+
+    def __init__(self, prefix, obj, listener):
+        self.prefix = prefix
+        self.obj = obj
+        self.listener = listener
+        self.cache = {}
+
+    def format(self, print_stack=True, use_indent=False):
+        key = (print_stack, use_indent)
+        if key not in self.cache:
+            if not print_stack:
+                obj = strip_key(self.obj, "stack")
+            elif use_indent:
+                obj = self.listener.find_stack(self.obj)
+            else:
+                obj = self.obj
+
+            indent = 2 if use_indent else None
+            self.cache[key] = self.prefix + json.dumps(obj, indent=indent)
+        return self.cache[key]
+
+    def __str__(self):
+        return self.format(use_indent=self.listener.format in
+                           ["pprint", "pprint-color"])
+
+
+class QueueFileHandler(logging.Handler):
+    """Writes log records to a file on a background thread.
+
+    Records get queued, and are formatted and written in batches by the
+    writer thread, so logging never blocks the thread which receives the
+    events. If the queue is full the record gets dropped. Records which are
+    written more than late_threshold seconds after they have been created
+    are counted as late.
+
+    """
+
+    def __init__(self, filename, mode='w', queue_size=10000, batch_size=100,
+                 late_threshold=5.):
+        logging.Handler.__init__(self)
+        self.stream = open(filename, mode)
+        self.queue = Queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.late_threshold = late_threshold
+
+        self.dropped = 0
+        self.late = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        # the record could be changed by other handlers meanwhile
+        record = logging.makeLogRecord(record.__dict__)
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            if time.time() - record.created > self.late_threshold:
+                self.late += 1
+            try:
+                line = self.format(record) + '\n'
+                if isinstance(line, unicode):
+                    line = line.encode('utf-8')
+                lines.append(line)
+            except Exception:
+                self.handleError(record)
+
+        self.stream.write(''.join(lines))
+        self.stream.flush()
+
+    def run(self):
+        running = True
+        while running:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            if None in records:
+                running = False
+                records = [record for record in records if record is not None]
+
+            try:
+                self.write(records)
+            finally:
+                for i in range(len(records) + (0 if running else 1)):
+                    self.queue.task_done()
+
+    def flush(self):
+        """Wait until all queued records have been written."""
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+            self.stream.close()
+        logging.Handler.close(self)
+
+
 class LoggerListener(object):
     stack_regex = re.compile("(.*)@(.*?)(?: -> (file\:\/\/\/\S*))?\:(\d*)$")
     name = 'Logging'
@@ -61,9 +190,10 @@ class LoggerListener(object):
         console.setLevel(levels[console_level])
         self.logger.addHandler(console)
 
+        self.file_handler = None
         if log_file:
             print_stack = file_level not in ["WARNING", "INFO"]
-            handler = logging.FileHandler(log_file, 'w')
+            handler = self.file_handler = QueueFileHandler(log_file, 'w')
             formatter = ColorFormatter(template, use_color=use_color, print_stack=print_stack, use_indent=use_indent)
             handler.setFormatter(formatter)
             handler.setLevel(levels[file_level])
@@ -127,46 +257,58 @@ class LoggerListener(object):
                           metavar="[json|pprint|pprint-color]",
                           help="Format for logging (default: %default)")
 
+    # levels and message prefixes of the events
+    event_messages = {
+        'mozmill.pass': (logging.DEBUG, 'Step Pass: '),
+        'mozmill.fail': (logging.ERROR, 'Test Failure | '),
+        'mozmill.frameworkFail': (logging.CRITICAL, 'Framework Failure | '),
+        'mozmill.skip': (logging.DEBUG, 'Test Skipped: '),
+    }
+
+    def accepts(self, event):
+        """Returns whether any handler would log the event.
+
+        The back channel caches the answer, so the levels and handlers of
+        the logger must not change once it has been registered.
+
+        """
+        level = self.event_messages.get(event, (logging.DEBUG,))[0]
+        return any(level >= handler.level for handler in self.logger.handlers)
+
     def __call__(self, event, obj):
-        string = json.dumps(obj)
-        if self.format in ["pprint", "pprint-color"]:
-            string = self.pprint(obj)
-
-        if event == 'mozmill.pass':
-            self.logger.debug('Step Pass: ' + string)
-        elif event == 'mozmill.fail':
-            self.logger.error('Test Failure | ' + string)
-        elif event == 'mozmill.frameworkFail':
-            self.logger.fatal('Framework Failure | ' + string)
-        elif event == 'mozmill.skip':
-            self.logger.debug('Test Skipped: ' + string)
-        else:
-            self.logger.debug(str(event) + ' | ' + string)
+        # skip events no handler would log, like the passes at INFO level
+        if not self.accepts(event):
+            return
+
+        level, prefix = self.event_messages.get(
+            event, (logging.DEBUG, str(event) + ' | '))
+        self.logger.log(level, EventMessage(prefix, obj, self))
 
     def pprint(self, obj):
-        self.find_stack(obj)
-        return json.dumps(obj, indent=2)
+        return json.dumps(self.find_stack(obj), indent=2)
 
     def find_stack(self, obj):
-        """Split any stacktrace string into an array."""
-        if type(obj) == dict or type(obj) == list:
-            iter = obj
-            if type(obj) == list:
-                iter = range(len(obj))
-
-            for i in iter:
-                child = obj[i]
-                if i == "stack":
+        """Returns a copy of obj with any stacktrace split into an array."""
+        if isinstance(obj, dict):
+            result = {}
+            for key, child in obj.items():
+                if key == "stack":
                     if isinstance(child, basestring):
                         # It is not very pythonic, but we need to do something
                         # completely different if our stack is a string and
                         # not an object. It's much more readable to simply
                         # have two separate functions
-                        obj[i] = self.clean_stack_as_string(child)
+                        result[key] = self.clean_stack_as_string(child)
                     else:
-                        obj[i] = self.clean_stack(child)
+                        result[key] = self.clean_stack(child)
                 else:
-                    self.find_stack(child)
+                    result[key] = self.find_stack(child)
+            return result
+
+        if isinstance(obj, list):
+            return [self.find_stack(child) for child in obj]
+
+        return obj
 
     def clean_stack(self, caller):
         try:
@@ -227,6 +369,15 @@ class LoggerListener(object):
         self.logger.log(level, "Failed: %d" % len(results.fails))
         self.logger.log(level, "Skipped: %d" % len(results.skipped))
 
+        if self.file_handler:
+            self.file_handler.flush()
+            if self.file_handler.dropped or self.file_handler.late:
+                self.logger.warning("Log file: %d records dropped, %d "
+                                    "written late" %
+                                    (self.file_handler.dropped,
+                                     self.file_handler.late))
+                self.file_handler.flush()
+
     ### event listeners
 
     def disconnected(self, message):
@@ -310,23 +461,7 @@ class ColorFormatter(logging.Formatter):
                               levelname + self.RESET_SEQ
             record.levelname = levelname_color
 
-        if not self.print_stack:
-            try:
-                message = record.msg.rsplit("|", 1)
-                string = message[1]
-                dictionary = json.loads(string)
-                dictionary = self.removeKey(dictionary, "stack")
-                if self.use_indent:
-                    return record.levelname + " | " + message[0] + "| " + json.dumps(dictionary, indent=2)
-                return record.levelname + " | " + message[0] + "| " + json.dumps(dictionary)
-            except:
-                pass
+        if isinstance(record.msg, EventMessage):
+            message = record.msg.format(self.print_stack, self.use_indent)
+            return record.levelname + " | " + message
         return logging.Formatter.format(self, record)
-
-    def removeKey(self, dictionary, key):
-        for (k,v) in dictionary.items():
-            if k == key:
-                del dictionary[k]
-            if isinstance(v, dict):
-                self.removeKey(v, key)
-        return dictionary
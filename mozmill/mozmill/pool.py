@@ -0,0 +1,346 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Pool of started applications which can be leased by mozmill runs.
+
+The pool daemon keeps a number of applications running with jsbridge
+connected. A mozmill run leases one of them through a local socket, and
+controls it via a PooledRunner which stands in for the MozRunner. Once the
+lease has been released, or its connection got lost, the application is
+stopped, its profile reset, and it gets started again for the next lease.
+
+Requests and responses are exchanged as JSON lines.
+
+"""
+
+import json
+import Queue
+import socket
+import SocketServer
+import threading
+import traceback
+
+import jsbridge
+
+from .errors import PoolError
+
+
+DEFAULT_PORT = 24243
+
+js_module_utils = 'Components.utils.import("resource://mozmill/stdlib/utils.js")'
+
+
+def parse_address(address):
+    """Returns the (host, port) tuple for an address like 'host:port'."""
+    host, _, port = address.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise PoolError('Invalid pool address: %s' % address)
+
+
+### daemon side
+
+class PooledApplication(object):
+    """Application which is kept running by the pool."""
+
+    # commands a lease can send for the application
+    commands = ('start', 'stop', 'wait', 'is_running', 'returncode',
+                'reset', 'reset_profile', 'check_for_crashes',
+                'set_preferences')
+
+    def __init__(self, runner, jsbridge_port, timeout=60.):
+        self.runner = runner
+        self.jsbridge_port = jsbridge_port
+        self.timeout = timeout
+        self.bridge = None
+
+    def info(self):
+        return {'binary': self.runner.binary,
+                'jsbridge_port': self.jsbridge_port}
+
+    def connect(self):
+        back_channel, self.bridge = jsbridge.wait_and_create_network(
+            '127.0.0.1', self.jsbridge_port, self.timeout)
+
+        # events are only of interest for the lease
+        back_channel.close()
+
+    def disconnect(self):
+        if self.bridge:
+            self.bridge.close()
+            self.bridge = None
+
+    def start(self):
+        """Start the application and wait until jsbridge is connected."""
+        if not self.runner.is_running():
+            self.disconnect()
+            self.runner.start()
+        if not (self.bridge and self.bridge.connected):
+            self.connect()
+
+    def stop(self):
+        self.disconnect()
+        self.runner.stop()
+
+    def wait(self, timeout=None):
+        return self.runner.wait(timeout=timeout)
+
+    def is_running(self):
+        return self.runner.is_running()
+
+    def returncode(self):
+        return self.runner.returncode
+
+    def reset(self):
+        self.runner.reset()
+
+    def reset_profile(self):
+        self.runner.profile.reset()
+
+    def check_for_crashes(self, dump_save_path=None, test_name=None):
+        return self.runner.check_for_crashes(dump_save_path=dump_save_path,
+                                             test_name=test_name)
+
+    def set_preferences(self, preferences):
+        """Set preferences in the profile and the running application."""
+        self.runner.profile.set_persistent_preferences(preferences)
+
+        if self.runner.is_running():
+            self.start()
+            for name, value in preferences.items():
+                self.bridge.execFunction(js_module_utils + '.setPreference',
+                                         [name, value])
+
+    def handle(self, command, args):
+        if command not in self.commands:
+            raise PoolError('Unknown command: %s' % command)
+        return getattr(self, command)(*args)
+
+    def recycle(self):
+        """Stop the application, reset its profile, and start it again."""
+        self.stop()
+        self.runner.reset()
+        self.runner.profile.reset()
+        self.start()
+
+    def close(self):
+        self.stop()
+        self.runner.cleanup()
+
+
+class BrowserPool(object):
+    """Keeps a number of started applications ready to be leased."""
+
+    def __init__(self, create_application, size=2):
+        """Constructor of the BrowserPool class.
+
+        Arguments:
+        create_application -- Callable which returns a new PooledApplication
+
+        Keyword arguments:
+        size -- Number of applications kept in the pool
+
+        """
+        self.create_application = create_application
+        self.size = size
+
+        self.applications = []
+        self.ready = Queue.Queue()
+
+    def start(self):
+        """Start all applications of the pool in the background."""
+        for i in range(self.size):
+            application = self.create_application()
+            self.applications.append(application)
+            self.prepare(application, application.start)
+
+    def prepare(self, application, method):
+        def run():
+            try:
+                method()
+                self.ready.put(application)
+            except Exception:
+                # the application is lost for the pool
+                print 'Failed to prepare application for the pool:'
+                traceback.print_exc()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def lease(self, timeout=None):
+        """Returns the next ready application."""
+        try:
+            return self.ready.get(True, timeout)
+        except Queue.Empty:
+            raise PoolError('No application available within %ss' % timeout)
+
+    def release(self, application):
+        """Recycle the application and make it available again."""
+        self.prepare(application, application.recycle)
+
+    def close(self):
+        for application in self.applications:
+            try:
+                application.close()
+            except Exception:
+                traceback.print_exc()
+        self.applications = []
+
+
+class PoolRequestHandler(SocketServer.StreamRequestHandler):
+    """Serves a single lease for the lifetime of the connection."""
+
+    def handle(self):
+        pool = self.server.pool
+        application = None
+
+        try:
+            for line in iter(self.rfile.readline, ''):
+                request = json.loads(line)
+                command = request.get('command')
+                args = request.get('args', [])
+
+                try:
+                    if command == 'lease':
+                        if application is None:
+                            application = pool.lease(*args)
+                        result = application.info()
+                    elif command == 'release':
+                        result = None
+                    elif application is None:
+                        raise PoolError('No application has been leased')
+                    else:
+                        result = application.handle(command, args)
+                    response = {'result': result}
+                except Exception, e:
+                    response = {'error': '%s: %s' % (e.__class__.__name__, e)}
+
+                self.wfile.write(json.dumps(response) + '\n')
+                self.wfile.flush()
+
+                if command == 'release':
+                    break
+        except socket.error:
+            pass
+        finally:
+            if application is not None:
+                pool.release(application)
+
+
+class PoolServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Hands out the applications of a pool to local clients."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, pool):
+        self.pool = pool
+        SocketServer.TCPServer.__init__(self, address, PoolRequestHandler)
+
+
+### client side
+
+class PooledProfile(object):
+    """Profile of a leased application."""
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def set_persistent_preferences(self, preferences):
+        self.runner.request('set_preferences', preferences)
+
+    def reset(self):
+        self.runner.request('reset_profile')
+
+
+class PooledRunner(object):
+    """Runner for an application leased from a pool daemon.
+
+    It provides the parts of the MozRunner API which are used by MozMill,
+    and forwards them to the daemon which owns the application process.
+    The application gets returned to the pool by cleanup().
+
+    """
+
+    def __init__(self, address, timeout=None):
+        """Lease an application from the pool daemon.
+
+        Arguments:
+        address -- (host, port) tuple of the pool daemon
+
+        Keyword arguments:
+        timeout -- How long to wait for an available application
+
+        """
+        self.socket = socket.create_connection(address)
+        self.file = self.socket.makefile('rwb')
+        self.lock = threading.Lock()
+
+        try:
+            info = self.request('lease', timeout)
+        except PoolError:
+            self.file.close()
+            self.socket.close()
+            raise
+
+        self.binary = info['binary']
+        self.jsbridge_port = info['jsbridge_port']
+        self.profile = PooledProfile(self)
+
+    def request(self, command, *args):
+        if self.file is None:
+            raise PoolError('The application has already been released')
+
+        with self.lock:
+            self.file.write(json.dumps({'command': command,
+                                        'args': args}) + '\n')
+            self.file.flush()
+            line = self.file.readline()
+
+        if not line:
+            raise PoolError('Connection to the pool daemon lost')
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise PoolError(response['error'])
+        return response['result']
+
+    def start(self, debug_args=None, interactive=False):
+        # the application is already running unless it has been stopped
+        self.request('start')
+
+    def stop(self):
+        self.request('stop')
+
+    def wait(self, timeout=None):
+        return self.request('wait', timeout)
+
+    def is_running(self):
+        return self.request('is_running')
+
+    @property
+    def returncode(self):
+        return self.request('returncode')
+
+    def reset(self):
+        self.request('reset')
+
+    def check_for_crashes(self, dump_save_path=None, test_name=None):
+        return self.request('check_for_crashes', dump_save_path, test_name)
+
+    def cleanup(self):
+        """Return the application to the pool."""
+        if self.file is None:
+            return
+
+        try:
+            self.request('release')
+        except (PoolError, socket.error):
+            pass
+
+        self.file.close()
+        self.socket.close()
+        self.file = None
@@ -0,0 +1,195 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Cache of profile templates with the add-ons already installed.
+
+Installing the mozmill and jsbridge extensions is the expensive part of
+creating a profile. The cache installs them once into a template, which is
+stored under a hash of the add-on contents. Profiles are created, and reset,
+by cloning the template. The files of the add-ons are hard linked where
+possible, all others get copied, because the application modifies them in
+place. Preferences are still written for each profile, because some of them
+like the jsbridge port differ between runs.
+
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import mozfile
+from mozprofile import AddonManager
+
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'mozmill-profiles')
+
+# files in the extensions folder which are written by the application
+MUTABLE_EXTENSIONS = ('.ini', '.json', '.sqlite')
+
+
+def is_read_only(path):
+    """Returns whether the file of a profile is never modified in place.
+
+    Only the files of installed add-ons are, all others like prefs.js or
+    the databases are written to by the application or by mozprofile.
+
+    """
+    parts = path.split(os.sep)
+    return (len(parts) > 2 and parts[0] == 'extensions' and
+            os.path.splitext(path)[1] not in MUTABLE_EXTENSIONS)
+
+
+def clone_tree(source, destination):
+    """Clone a directory tree of a profile.
+
+    The files of add-ons get hard linked, all others copied, so changes
+    to the clone never end up in the source. Files also get copied if hard
+    links are not supported.
+
+    """
+    for root, dirs, files in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+
+        for filename in files:
+            path = os.path.join(root, filename)
+            if is_read_only(os.path.relpath(path, source)):
+                try:
+                    os.link(path, os.path.join(target, filename))
+                    continue
+                except (AttributeError, OSError):
+                    pass
+            shutil.copy2(path, os.path.join(target, filename))
+
+
+class ClonedProfile(object):
+    """Profile which is created and reset as a clone of a template.
+
+    Only used as mixin for the profile class of the application, see
+    ProfileCache.profile_class().
+
+    """
+
+    def __init__(self, template, **kwargs):
+        self.template = template
+        self.kwargs = kwargs
+
+        profile = tempfile.mkdtemp(suffix='.mozrunner')
+        clone_tree(template, profile)
+
+        super(ClonedProfile, self).__init__(profile=profile, **kwargs)
+
+    def cleanup(self):
+        if self.restore and os.path.exists(self.profile):
+            mozfile.remove(self.profile)
+
+    def set_persistent_preferences(self, preferences):
+        # keep them for the profile created on reset
+        persistent = dict(self.kwargs.get('preferences') or {})
+        persistent.update(preferences)
+        self.kwargs['preferences'] = persistent
+
+        super(ClonedProfile, self).set_persistent_preferences(preferences)
+
+    def reset(self):
+        mozfile.remove(self.profile)
+        clone_tree(self.template, self.profile)
+
+        super(ClonedProfile, self).__init__(profile=self.profile,
+                                            **self.kwargs)
+
+
+class ProfileCache(object):
+    """Creates profiles from cached templates."""
+
+    # profile classes mixed with ClonedProfile
+    profile_classes = {}
+
+    def __init__(self, directory=None):
+        self.directory = directory or DEFAULT_CACHE_DIR
+
+    def key(self, addons):
+        """Returns the hash of the contents of the given add-ons."""
+        sha = hashlib.sha1()
+
+        for addon in addons:
+            if os.path.isfile(addon):
+                paths = [addon]
+            else:
+                paths = []
+                for root, dirs, files in os.walk(addon):
+                    dirs.sort()
+                    paths.extend(os.path.join(root, filename)
+                                 for filename in sorted(files))
+
+            for path in paths:
+                sha.update(os.path.relpath(path, addon) + '\0')
+                with open(path, 'rb') as f:
+                    sha.update(f.read())
+
+        return sha.hexdigest()
+
+    def template(self, addons):
+        """Returns the path of the template with the given add-ons."""
+        path = os.path.join(self.directory, self.key(addons))
+        if os.path.isdir(path):
+            return path
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # created meanwhile by another process
+                pass
+
+        # build the template aside and move it in place when complete
+        build_path = tempfile.mkdtemp(dir=self.directory)
+        AddonManager(build_path, restore=False).install_addons(addons)
+        try:
+            os.rename(build_path, path)
+        except OSError:
+            # built meanwhile by another process
+            mozfile.remove(build_path)
+
+        return path
+
+    def profile_class(self, profile_class):
+        """Returns the profile class mixed with ClonedProfile."""
+        if profile_class not in self.profile_classes:
+            name = 'Cloned%s' % profile_class.__name__
+            self.profile_classes[profile_class] = type(
+                name, (ClonedProfile, profile_class), {})
+        return self.profile_classes[profile_class]
+
+    def create_profile(self, profile_class, profile=None, addons=None,
+                       **kwargs):
+        """Create a profile of the given class cloned from a template.
+
+        Profiles which can't be cached, like given profiles or ones with
+        add-ons from URLs, are created without a template.
+
+        """
+        addons = addons or []
+        if isinstance(addons, basestring):
+            addons = [addons]
+
+        cacheable = (not profile and
+                     all(os.path.exists(addon) for addon in addons) and
+                     not [key for key, value in kwargs.items()
+                          if value and key not in ('preferences', 'restore')])
+        if not cacheable:
+            return profile_class(profile=profile, addons=addons, **kwargs)
+
+        template = self.template(addons)
+        return self.profile_class(profile_class)(template, **kwargs)
+
+
+def create_profile(profile_class, profile_args, cache_dir=None):
+    """Create a profile, cloned from a template in cache_dir if given."""
+    if not cache_dir:
+        return profile_class(**profile_args)
+    return ProfileCache(cache_dir).create_profile(profile_class,
+                                                  **profile_args)
@@ -3,9 +3,17 @@
 # file, you can obtain one at http://mozilla.org/MPL/2.0/.
 
 import datetime
+import getpass
+import glob
+import gzip
+import hashlib
 import json
+import os
 import platform
+import socket
 import sys
+import tempfile
+import types
 import urllib2
 
 import mozinfo
@@ -36,11 +44,68 @@ if mozinfo.isMac and '10.6' in mozinfo.version:
     socket._socketobject.sendall = socket_sendall
 
 
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(),
+                                 'mozmill-reports-%s' % getpass.getuser())
+
+# status codes of reports the server will never accept, which get dropped
+# from the spool; all other failed uploads are retried with the next report
+REJECTED_STATUS_CODES = (400, 409, 413, 415)
+
+
+def iterencode(obj, encoder=json.JSONEncoder()):
+    """Encode obj as JSON in chunks.
+
+    Generators are encoded as arrays one item at a time, so they never have
+    to be held in memory completely.
+
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        for i, (key, value) in enumerate(obj.items()):
+            yield (', ' if i else '') + encoder.encode(key) + ': '
+            for chunk in iterencode(value, encoder):
+                yield chunk
+        yield '}'
+    elif isinstance(obj, types.GeneratorType):
+        yield '['
+        for i, item in enumerate(obj):
+            if i:
+                yield ', '
+            for chunk in encoder.iterencode(item):
+                yield chunk
+        yield ']'
+    else:
+        for chunk in encoder.iterencode(obj):
+            yield chunk
+
+
+def get_system_info():
+    """Returns information about the system the tests are running on."""
+    return {"bits": str(mozinfo.bits),
+            "hostname": platform.node(),
+            "processor": mozinfo.processor,
+            "service_pack": getattr(mozinfo, 'service_pack', ''),
+            "system": mozinfo.os.title(),
+            "version": mozinfo.version
+    }
+
+
 class Report(object):
-    def __init__(self, report, date_format="%Y-%m-%dT%H:%M:%SZ"):
+    """Report the results to a CouchDB instance, a file, or stdout.
+
+    Reports for CouchDB are written gzip compressed to a spool directory
+    first, and are uploaded from there. Reports which could not be uploaded
+    are kept in the spool, and get uploaded with the next report to the
+    same URL, unless the server rejected them as invalid.
+
+    """
+
+    def __init__(self, report, report_spool=None,
+                 date_format="%Y-%m-%dT%H:%M:%SZ"):
         if not isinstance(report, basestring):
             raise HandlerMatchException
         self.report = report
+        self.report_spool = report_spool or DEFAULT_SPOOL_DIR
         self.date_format = date_format
 
     def events(self):
@@ -56,13 +121,24 @@ class Report(object):
                           metavar='URL',
                           help="Report the results. Requires URL to results "
                                "server. Use 'stdout' for stdout.")
+        parser.add_option("--report-spool",
+                          dest="report_spool",
+                          default=DEFAULT_SPOOL_DIR,
+                          metavar='PATH',
+                          help="Directory to keep reports in until they have "
+                               "been uploaded (default: %default)")
 
     def stop(self, results, fatal=False):
         results = self.get_report(results)
         return self.send_report(results, self.report)
 
     def get_report(self, results):
-        """Get the report results."""
+        """Get the report results.
+
+        The results of the tests are generated while the report gets
+        encoded, see iterencode().
+
+        """
 
         report = {'report_type': 'mozmill-test',
                   'mozmill_version': results.mozmill_version,
@@ -72,24 +148,66 @@ class Report(object):
                   'tests_passed': len(results.passes),
                   'tests_failed': len(results.fails),
                   'tests_skipped': len(results.skipped),
-                  'results': results.alltests,
+                  'results': (dict(test) for test in results.alltests),
                   'screenshots': results.screenshots,
                   }
 
         if results.appinfo:
             report.update(results.appinfo)
 
-        report['system_info'] = {"bits": str(mozinfo.bits),
-                                 "hostname": platform.node(),
-                                 "processor": mozinfo.processor,
-                                 "service_pack": getattr(mozinfo,
-                                                         'service_pack', ''),
-                                 "system": mozinfo.os.title(),
-                                 "version": mozinfo.version
-        }
+        report['system_info'] = get_system_info()
 
         return report
 
+    def spool_directory(self, report_url):
+        """Returns the spool directory for reports to the given URL."""
+        return os.path.join(self.report_spool,
+                            hashlib.sha1(report_url).hexdigest())
+
+    def spool_report(self, results, report_url):
+        """Write the compressed report to the spool and return its path."""
+        directory = self.spool_directory(report_url)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write aside and rename, so only complete reports get uploaded
+        fd, path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            stream = gzip.GzipFile(fileobj=f, mode='wb')
+            for chunk in iterencode(results):
+                stream.write(chunk.encode('utf-8')
+                             if isinstance(chunk, unicode) else chunk)
+            stream.close()
+
+        spooled = '%s-%s.json.gz' % (
+            datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f'),
+            os.path.basename(path)[:-len('.tmp')])
+        spooled = os.path.join(directory, spooled)
+        os.rename(path, spooled)
+
+        return spooled
+
+    def upload_report(self, path, report_url):
+        """Upload a spooled report, and remove it once it has been stored.
+
+        Returns the response of CouchDB.
+
+        """
+        with open(path, 'rb') as f:
+            # The POST is implied by the body data, which is streamed
+            request = urllib2.Request(report_url, f,
+                                      {"Content-Type": "application/json",
+                                       "Content-Encoding": "gzip",
+                                       "Content-Length":
+                                           str(os.path.getsize(path))})
+
+            # Get response which contains the id of the new document
+            response = urllib2.urlopen(request, timeout=30)
+            data = json.loads(response.read())
+
+        os.remove(path)
+        return data
+
     def send_report(self, results, report_url):
         """Send a report of the results to a CouchdB instance or a file."""
 
@@ -105,7 +223,9 @@ class Report(object):
                 print "Printing results to '%s' failed (%s)." % (filename, e)
                 return
         if f:
-            print >> f, json.dumps(results)
+            for chunk in iterencode(results):
+                f.write(chunk)
+            f.write('\n')
             return
 
         # report to CouchDB
@@ -114,31 +234,137 @@ class Report(object):
             now = datetime.datetime.utcnow()
             results['time_upload'] = now.strftime(self.date_format)
 
-            # Send a POST request to the DB.
-            # The POST is implied by the body data
-            body = json.dumps(results)
-            request = urllib2.Request(report_url, body,
-                                      {"Content-Type": "application/json"})
+            path = self.spool_report(results, report_url)
+        except Exception as e:
+            print "Sending results to '%s' failed (%s)." % (report_url,
+                                                            str(e))
+            return
 
-            # Get response which contains the id of the new document
-            response = urllib2.urlopen(request, timeout=30)
-            data = json.loads(response.read())
+        # upload the reports of previous runs first
+        pending = sorted(glob.glob(os.path.join(
+            self.spool_directory(report_url), '*.json.gz')))
 
-            # Print document location to the console and return
-            print "Report document created at '%s%s'" % (report_url,
-                                                         data['id'])
-            return data
-        except urllib2.HTTPError as e:
+        data = None
+        for spooled in pending:
+            retry = True
             try:
-              data = json.loads(e.read())
-              print "Sending results to '%s' failed (%s)." % (report_url,
-                                                              data['reason'])
-            except ValueError:
-              print "Sending results to '%s' failed (%s)." % (report_url,
-                                                              str(e))
-        except urllib2.URLError as e:
+                response = self.upload_report(spooled, report_url)
+            except urllib2.HTTPError as e:
+                try:
+                    reason = json.loads(e.read())['reason']
+                except (ValueError, KeyError):
+                    reason = str(e)
+
+                # a report rejected by the server won't be accepted later
+                retry = e.code not in REJECTED_STATUS_CODES
+            except urllib2.URLError as e:
+                reason = e.reason
+            except Exception as e:
+                reason = str(e)
+            else:
+                # Print document location to the console
+                print "Report document created at '%s%s'" % (report_url,
+                                                             response['id'])
+                if spooled == path:
+                    data = response
+                continue
+
             print "Sending results to '%s' failed (%s)." % (report_url,
-                                                            e.reason)
+                                                            reason)
+            if not retry:
+                os.remove(spooled)
+                continue
+
+            # keep this and all following reports for the next run
+            print "Reports kept in '%s' for the next run." % \
+                os.path.dirname(spooled)
+            break
+
+        return data
+
+
+class StreamReport(object):
+    """Stream the results as JSON lines while the tests are running.
+
+    A line is written for each endTest and endModule event as soon as it
+    arrives, so no results are kept in memory and none get lost if the
+    harness dies. A summary record is written when the run has finished.
+
+    """
+
+    def __init__(self, stream_report, date_format="%Y-%m-%dT%H:%M:%SZ"):
+        if not isinstance(stream_report, basestring):
+            raise HandlerMatchException
+        self.stream_report = stream_report
+        self.date_format = date_format
+        self.stream = self.open_stream(stream_report)
+
+    def events(self):
+        """Returns a mapping of event types (strings) to methods."""
+        return {'mozmill.endTest': self.endTest,
+                'mozmill.endModule': self.endModule}
+
+    @classmethod
+    def add_options(cls, parser):
+        """Add options to the parser."""
+        parser.add_option("--stream-report",
+                          dest="stream_report",
+                          default=None,
+                          metavar='URL',
+                          help="Stream the results as JSON lines while the "
+                               "tests are running. Requires a file:// or "
+                               "tcp://host:port URL. Use 'stdout' for "
+                               "stdout.")
+
+    def open_stream(self, url):
+        """Open the file or socket to write the records to."""
+        try:
+            if url == 'stdout':
+                return sys.stdout
+            if url.startswith('file://'):
+                return file(url.split('file://', 1)[1], 'w')
+            if url.startswith('tcp://'):
+                host, port = url.split('tcp://', 1)[1].rsplit(':', 1)
+                connection = socket.create_connection((host, int(port)))
+                return connection.makefile('w')
+            raise ValueError('unsupported URL')
         except Exception as e:
-            print "Sending results to '%s' failed (%s)." % (report_url,
-            str(e))
+            print "Streaming results to '%s' failed (%s)." % (url, e)
+
+    def write(self, record):
+        if not self.stream:
+            return
+
+        try:
+            self.stream.write(json.dumps(record) + '\n')
+            self.stream.flush()
+        except Exception as e:
+            print "Streaming results to '%s' failed (%s)." % (
+                self.stream_report, e)
+            self.stream = None
+
+    def endTest(self, test):
+        self.write({'event': 'mozmill.endTest', 'test': test})
+
+    def endModule(self, module):
+        self.write({'event': 'mozmill.endModule', 'module': module})
+
+    def stop(self, results, fatal=False):
+        summary = {'event': 'summary',
+                   'report_type': 'mozmill-test',
+                   'mozmill_version': results.mozmill_version,
+                   'time_start': results.starttime.strftime(self.date_format),
+                   'time_end': results.endtime.strftime(self.date_format),
+                   'tests_passed': len(results.passes),
+                   'tests_failed': len(results.fails),
+                   'tests_skipped': len(results.skipped),
+                   'fatal': fatal,
+                   'system_info': get_system_info(),
+                   }
+        if results.appinfo:
+            summary['application'] = results.appinfo
+        self.write(summary)
+
+        if self.stream and self.stream is not sys.stdout:
+            self.stream.close()
+        self.stream = None
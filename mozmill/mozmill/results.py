@@ -0,0 +1,133 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compact storage for the results of tests."""
+
+import json
+import os
+import tempfile
+import threading
+
+
+class DetailStore(object):
+    """Stores the detailed results of tests in a temporary file.
+
+    Each entry is written as a JSON line, and can be read back via the
+    offset returned by add().
+
+    """
+
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.lock = threading.Lock()
+
+    def add(self, obj):
+        with self.lock:
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(json.dumps(obj) + '\n')
+        return offset
+
+    def get(self, offset):
+        with self.lock:
+            self.file.seek(offset)
+            return json.loads(self.file.readline())
+
+    def close(self):
+        """Close and remove the temporary file."""
+        with self.lock:
+            self.file.close()
+
+
+class TestRecord(object):
+    """Compact record of a test result.
+
+    The summary of the test is kept in slots, and the details of its
+    passes and fails either in memory or in a DetailStore. The record can
+    be accessed like the dictionary sent with the endTest event.
+
+    """
+
+    __slots__ = ('filename', 'name', 'passed', 'failed',
+                 'time_start', 'time_end', 'extra', 'details', 'store')
+
+    summary_keys = ('filename', 'name', 'passed', 'failed',
+                    'time_start', 'time_end')
+    detail_keys = ('passes', 'fails')
+
+    def __init__(self, test, store=None, keep_passes=True):
+        """Create a record for the given test.
+
+        Arguments:
+        test -- Dictionary with the result of the test
+
+        Keyword arguments:
+        store -- DetailStore to save the passes and fails in
+        keep_passes -- If False the passes get dropped once counted
+
+        """
+        test = dict(test)
+        for key in self.summary_keys:
+            setattr(self, key, test.pop(key, None))
+
+        details = dict([(key, test.pop(key, [])) for key in self.detail_keys])
+        if not keep_passes:
+            details['passes'] = []
+
+        # everything else, like the skipped state or meta data of the test
+        self.extra = test or None
+
+        self.store = store
+        if store is not None:
+            self.details = store.add(details)
+        else:
+            self.details = details
+
+    def get_details(self):
+        if self.store is not None:
+            return self.store.get(self.details)
+        return self.details
+
+    def keys(self):
+        keys = [key for key in self.summary_keys
+                if getattr(self, key) is not None]
+        keys.extend(self.detail_keys)
+        keys.extend((self.extra or {}).keys())
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key in self.detail_keys:
+            return self.get_details()[key]
+
+        if key in self.summary_keys:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        details = self.get_details()
+        return [(key, details[key] if key in self.detail_keys else self[key])
+                for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
@@ -51,10 +51,12 @@ setup(name=PACKAGE_NAME,
       entry_points="""
           [console_scripts]
           mozmill = mozmill:cli
+          mozmill-pool = mozmill:pool_cli
 
           [mozmill.event_handlers]
           logging = mozmill.logger:LoggerListener
           report = mozmill.report:Report
+          stream = mozmill.report:StreamReport
           callbacks = mozmill.python_callbacks:PythonCallbacks
         """
 )
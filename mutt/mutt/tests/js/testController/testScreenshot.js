@@ -33,16 +33,21 @@ function testChrome() {
 
 function check_screenshot(aScreenshot, aName, aIsFile) {
   expect.equal(aScreenshot.name, aName, "Name has been set correctly.");
-  expect.match(aScreenshot.dataURL, "/^data:image\/.*/", "dataURL is available.");
 
   if (aIsFile) {
-    expect.ok(aScreenshot.filename, "Filename is available.");
+    // The screenshot gets saved in the background
+    assert.waitFor(function () {
+      return aScreenshot.filename;
+    }, "Filename is available.");
+    expect.ok(!aScreenshot.failure, "Screenshot has been saved without failure.");
+    expect.ok(aScreenshot.hash, "Hash is available.");
 
     let file = Cc['@mozilla.org/file/local;1'].createInstance(Ci.nsILocalFile);
     file.initWithPath(aScreenshot.filename);
     expect.ok(file.exists(), "Screenshot '" + file.path + "' has been saved.");
     file.remove(true);
   } else {
+    expect.match(aScreenshot.dataURL, "/^data:image\/.*/", "dataURL is available.");
     expect.ok(!aScreenshot.filename, "Filename should not be set.");
   }
 }
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozprocess import ProcessHandler
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+testdir = os.path.join(here, 'js-modules')
+
+
+class TestParallelOption(unittest.TestCase):
+    """Test the --parallel option."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.report = os.path.join(self.tempdir, 'report.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_mozmill(self, tests, parallel):
+        args = ['mozmill',
+                '-b', os.environ['BROWSER_PATH'],
+                '--parallel', str(parallel),
+                '--report', 'file://%s' % self.report]
+        for test in tests:
+            args.extend(['-t', os.path.join(testdir, test)])
+
+        process = ProcessHandler(args,
+                                 # stop mozmill from printing output to console
+                                 processOutputLine=[lambda line: None])
+        process.run()
+        process.wait()
+
+        with open(self.report) as f:
+            return process.proc.poll(), json.load(f)
+
+    def test_merged_results(self):
+        returncode, report = self.run_mozmill([
+            'newEmptyFunction.js',
+            os.path.join('useMozmill', 'testTestPass.js'),
+            os.path.join('useMozmill', 'testTestFails.js')], 2)
+
+        self.assertEqual(returncode, 1, 'A test failed')
+        self.assertEqual(report['tests_passed'], 2)
+        self.assertEqual(report['tests_failed'], 1)
+
+    def test_more_instances_than_tests(self):
+        returncode, report = self.run_mozmill(['newEmptyFunction.js'], 4)
+
+        self.assertEqual(returncode, 0, 'Test passed')
+        self.assertEqual(report['tests_passed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,5 +8,9 @@ function setupModule() {
 
 function test() {
   var backButton = findElement.ID(controller.window.document, 'back-button');
-  controller.screenshot(backButton, persisted.screenshotName, true);
+  var count = persisted.screenshotCount || 1;
+
+  for (var i = 0; i < count; i++) {
+    controller.screenshot(backButton, persisted.screenshotName, true);
+  }
 }
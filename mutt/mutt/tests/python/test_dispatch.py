@@ -0,0 +1,111 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+import unittest
+
+from mozmill import AsyncHandler
+from mozmill.dispatch import Dispatcher
+
+
+class TestDispatcher(unittest.TestCase):
+    """Test running calls on a pool of workers"""
+
+    def test_order_per_key(self):
+        dispatcher = Dispatcher(workers=3)
+        calls = {}
+
+        def call(key, value):
+            calls.setdefault(key, []).append(value)
+
+        for value in range(100):
+            for key in ('a', 'b', 'c', 'd'):
+                dispatcher.dispatch(key, call, key, value)
+        dispatcher.close()
+
+        for key in ('a', 'b', 'c', 'd'):
+            self.assertEqual(calls[key], range(100))
+
+        stats = dispatcher.stats()
+        self.assertEqual(stats['dispatched'], 400)
+        self.assertEqual(stats['handled'], 400)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_backpressure(self):
+        dispatcher = Dispatcher(workers=1, queue_size=1)
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        # the worker is stuck in the first call, so the queue runs full
+        thread = threading.Thread(target=lambda: [
+            dispatcher.dispatch('slow', release.wait) for i in range(3)])
+        thread.daemon = True
+        thread.start()
+
+        deadline = time.time() + 5
+        while not dispatcher.stats()['blocked'] and time.time() < deadline:
+            time.sleep(.01)
+        self.assertTrue(dispatcher.stats()['blocked'] >= 1)
+        self.assertFalse(dispatcher.join(timeout=.1))
+
+        release.set()
+        thread.join()
+        self.assertTrue(dispatcher.join(timeout=5))
+
+        stats = dispatcher.stats()
+        self.assertEqual(stats['handled'], 3)
+        self.assertEqual(stats['max_pending'], 3)
+        self.assertTrue(stats['blocked'] >= 1)
+        dispatcher.close()
+
+    def test_errors(self):
+        dispatcher = Dispatcher(workers=1)
+        calls = []
+
+        dispatcher.dispatch('key', lambda: 1 / 0)
+        dispatcher.dispatch('key', calls.append, 1)
+        dispatcher.close()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(dispatcher.stats()['errors'], 1)
+
+
+class TestAsyncHandler(unittest.TestCase):
+    """Test running event handlers on a dispatcher"""
+
+    def test_running_test(self):
+        class Handler(object):
+            def __init__(self):
+                self.tests = []
+
+            def events(self):
+                return {'mozmill.endTest': self.endTest}
+
+            def endTest(self, test):
+                self.tests.append((test, self.mozmill.running_test))
+
+        class FakeMozMill(object):
+            running_test = None
+
+        mozmill = FakeMozMill()
+        handler = Handler()
+        async_handler = AsyncHandler(handler, Dispatcher(workers=1))
+        async_handler.mozmill = mozmill
+        listener = async_handler.events()['mozmill.endTest']
+
+        for name in ('a', 'b'):
+            mozmill.running_test = name
+            listener(name)
+        async_handler.dispatcher.close()
+
+        # the handler sees the test which was running when the event fired
+        self.assertEqual(handler.tests, [('a', 'a'), ('b', 'b')])
+
+        async_handler.stop(None, False)
+        self.assertEqual(handler.mozmill, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
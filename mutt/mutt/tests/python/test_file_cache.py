@@ -0,0 +1,118 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import httplib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import wptserve
+
+from mozmill.filecache import CachedFileHandler
+
+
+class TestCachedFileHandler(unittest.TestCase):
+    """Test serving the files of the document root from memory"""
+
+    def setUp(self):
+        self.doc_root = tempfile.mkdtemp()
+        self.write('index.html', '<html>index</html>')
+        self.write('script.py', 'def main(request, response):\n'
+                                '    return "executed"\n')
+
+        self.handler = CachedFileHandler()
+        routes = [(method, path, self.handler
+                   if handler is wptserve.handlers.file_handler else handler)
+                  for method, path, handler in wptserve.routes.routes]
+
+        self.server = wptserve.server.WebTestHttpd(doc_root=self.doc_root,
+                                                   host='localhost', port=0,
+                                                   routes=routes)
+        self.server.start()
+
+        # all requests of a test are sent over the same connection
+        self.connection = httplib.HTTPConnection('localhost',
+                                                 self.server.port)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.stop()
+        shutil.rmtree(self.doc_root)
+
+    def write(self, filename, contents, mtime=None):
+        path = os.path.join(self.doc_root, filename)
+        with open(path, 'w') as f:
+            f.write(contents)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def request(self, path, headers=None):
+        self.connection.request('GET', path, headers=headers or {})
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def test_preload(self):
+        self.handler.preload(self.doc_root)
+        self.assertEqual(self.handler.stats()['files'], 1)
+
+        response, body = self.request('/index.html')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, '<html>index</html>')
+        self.assertEqual(self.handler.stats()['hits'], 1)
+
+        # other handlers are still used
+        response, body = self.request('/script.py')
+        self.assertEqual(body, 'executed')
+
+    def test_conditional_requests(self):
+        response, body = self.request('/index.html')
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
+        self.assertTrue(etag)
+        self.assertTrue(last_modified)
+
+        response, body = self.request('/index.html',
+                                      {'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, '')
+
+        response, body = self.request('/index.html',
+                                      {'If-Modified-Since': last_modified})
+        self.assertEqual(response.status, 304)
+
+        response, body = self.request('/index.html',
+                                      {'If-None-Match': '"other"'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, '<html>index</html>')
+
+    def test_changed_file(self):
+        self.handler.preload(self.doc_root)
+        etag = self.request('/index.html')[0].getheader('ETag')
+
+        self.write('index.html', '<html>changed</html>', time.time() + 10)
+        response, body = self.request('/index.html',
+                                      {'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, '<html>changed</html>')
+        self.assertNotEqual(response.getheader('ETag'), etag)
+
+    def test_max_size(self):
+        self.handler.max_size = 30
+        self.write('other.html', '<html>other</html>')
+
+        self.request('/index.html')
+        self.request('/other.html')
+
+        # the least recently used file has been dropped
+        self.assertEqual(self.handler.entries.keys(),
+                         [os.path.join(self.doc_root, 'other.html')])
+
+        response, body = self.request('/index.html')
+        self.assertEqual(body, '<html>index</html>')
+
+
+if __name__ == '__main__':
+    unittest.main()
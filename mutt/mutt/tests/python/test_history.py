@@ -0,0 +1,125 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill.history import TestHistory
+
+
+class TestTestHistory(unittest.TestCase):
+    """Test recording results and scheduling tests by them"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_history(self, durations):
+        history = TestHistory(self.path)
+        for path, duration in durations.items():
+            history.endModule({'filename': path,
+                               'time_start': 1000,
+                               'time_end': 1000 + duration})
+        return history
+
+    def create_tests(self, *paths):
+        return [{'name': path, 'path': path} for path in paths]
+
+    def paths(self, tests):
+        return [test['path'] for test in tests]
+
+    def test_save_and_load(self):
+        self.assertEqual(TestHistory(self.path).tests, {})
+
+        history = self.create_history({'a.js': 300, 'b.js': 100})
+        history.stop(None)
+
+        history = TestHistory(self.path)
+        self.assertEqual(sorted(history.tests.keys()), ['a.js', 'b.js'])
+        self.assertEqual(history.tests['a.js']['duration'], 300)
+        self.assertEqual(history.tests['b.js']['duration'], 100)
+
+    def test_invalid_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{"tests":')
+        self.assertEqual(TestHistory(self.path).tests, {})
+
+    def test_sort(self):
+        history = self.create_history({'a.js': 100, 'b.js': 300, 'c.js': 10})
+        tests = self.create_tests('a.js', 'b.js', 'c.js', 'd.js')
+
+        # unknown tests are estimated with the average duration
+        self.assertEqual(self.paths(history.sort(tests)),
+                         ['b.js', 'd.js', 'a.js', 'c.js'])
+
+    def test_balance(self):
+        history = self.create_history({'a.js': 600, 'b.js': 300,
+                                       'c.js': 300, 'd.js': 200,
+                                       'e.js': 100})
+        tests = self.create_tests('a.js', 'b.js', 'c.js', 'd.js', 'e.js')
+
+        buckets = history.balance(tests, 2)
+        self.assertEqual([self.paths(bucket) for bucket in buckets],
+                         [['a.js', 'd.js'], ['b.js', 'c.js', 'e.js']])
+
+    def test_balance_without_history(self):
+        history = TestHistory(self.path)
+        tests = self.create_tests('a.js', 'b.js', 'c.js', 'd.js', 'e.js')
+
+        buckets = history.balance(tests, 2)
+        self.assertEqual([len(bucket) for bucket in buckets], [3, 2])
+        self.assertEqual(sorted(sum(buckets, [])), sorted(tests))
+
+    def write(self, filename, contents):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_select(self):
+        module = self.write('module.js', 'exports.value = 1;')
+        failing = self.write('test_failing.js', 'require("module");')
+        passing = self.write('test_passing.js', '')
+        unchanged = self.write('test_unchanged.js', '')
+        new = self.write('test_new.js', '')
+
+        class Results(object):
+            alltests = [{'filename': failing, 'failed': 0},
+                        {'filename': failing, 'failed': 1},
+                        {'filename': passing, 'failed': 0},
+                        {'filename': unchanged, 'failed': 0}]
+
+        history = TestHistory(self.path)
+        for path in (failing, passing, unchanged):
+            dependencies = [module] if path == failing else []
+            history.endModule({'filename': path,
+                               'dependencies': dependencies,
+                               'time_start': 0,
+                               'time_end': 10})
+        history.stop(Results())
+
+        tests = self.create_tests(failing, passing, unchanged, new)
+        history = TestHistory(self.path)
+        self.assertEqual(self.paths(history.select(tests, failed=True)),
+                         [failing])
+        self.assertEqual(self.paths(history.select(tests, changed=True)),
+                         [new])
+
+        # changes of the test or the modules it requires are detected
+        self.write('test_passing.js', '// changed')
+        self.assertEqual(self.paths(history.select(tests, changed=True)),
+                         [passing, new])
+        self.write('module.js', 'exports.value = 2;')
+        self.assertEqual(self.paths(history.select(tests, failed=True,
+                                                   changed=True)),
+                         [failing, passing, new])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+
+import jsbridge
+import mozmill
+
+
+class TestJSBridgeBatch(unittest.TestCase):
+    """Test batched operations of the bridge"""
+
+    def setUp(self):
+        self.mozmill = mozmill.MozMill.create()
+        self.mozmill.start_runner()
+        self.bridge = self.mozmill.bridge
+
+    def tearDown(self):
+        self.mozmill.stop_runner()
+        self.mozmill.stop()
+        self.mozmill.finish()
+
+    def test_batch(self):
+        batch = self.bridge.batch()
+        batch.set(mozmill.js_module_frame)
+        batch.setAttribute(mozmill.js_module_frame, 'batched', {'foo': 'bar'})
+        batch.describe(mozmill.js_module_frame + '.batched')
+        batch.execFunction('JSON.stringify', [[1, 2]])
+        self.assertEqual(len(batch), 4)
+
+        responses = batch.send()
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(len(responses), 4)
+
+        self.assertTrue(responses[0]['data'].startswith('bridge.registry'))
+        self.assertEqual(responses[2]['type'], 'object')
+        self.assertEqual(responses[2]['attributes'], ['foo'])
+
+        description = self.bridge.describe(responses[3]['data'])
+        self.assertEqual(description['data'], '[1,2]')
+
+    def test_batch_exception(self):
+        batch = self.bridge.batch()
+        batch.describe('bridge')
+        batch.execFunction('undefinedFunction', [])
+        self.assertRaises(jsbridge.JavaScriptError, batch.send)
+
+        batch.describe('bridge')
+        batch.execFunction('undefinedFunction', [])
+        responses = batch.send(raise_exeption=False)
+        self.assertTrue(responses[0]['result'])
+        self.assertFalse(responses[1]['result'])
+
+
+if __name__ == '__main__':
+    unittest.main()
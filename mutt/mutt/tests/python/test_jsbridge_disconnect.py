@@ -0,0 +1,48 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import time
+import unittest
+
+import mozmill
+
+
+js_module_events = ('Components.utils.import('
+                    '"resource://jsbridge/modules/Events.jsm").Events')
+
+
+class TestJSBridgeDisconnect(unittest.TestCase):
+    """Test that the extension cleans up connections closed by the harness"""
+
+    def setUp(self):
+        self.mozmill = mozmill.MozMill.create()
+        self.mozmill.start_runner()
+        self.bridge = self.mozmill.bridge
+
+    def tearDown(self):
+        self.mozmill.stop_runner()
+        self.mozmill.stop()
+        self.mozmill.finish()
+
+    def back_channels(self):
+        return self.bridge.describe(js_module_events +
+                                    '.backChannels.length')['data']
+
+    def test_close_back_channel(self):
+        self.assertEqual(self.back_channels(), 1)
+
+        self.mozmill.back_channel.close()
+
+        timeout = time.time() + 10
+        while self.back_channels() and time.time() < timeout:
+            time.sleep(.1)
+        self.assertEqual(self.back_channels(), 0)
+
+        # the bridge is still served
+        self.assertTrue(self.bridge.connected)
+        self.assertEqual(self.bridge.describe('1 + 1')['data'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import socket
+import time
+import unittest
+
+import jsbridge
+from jsbridge import network
+from jsbridge.network import Bridge, EventLoop, socketpair
+
+
+class TestEventLoopErrors(unittest.TestCase):
+    """Test that errors in a channel don't stop the event loop"""
+
+    def setUp(self):
+        sock, self.peer = socketpair()
+        self.bridge = Bridge('127.0.0.1', 0, timeout=30, sock=sock)
+
+    def tearDown(self):
+        self.bridge.close()
+        self.peer.close()
+
+    def test_harness_failure(self):
+        response = self.bridge.run('uuid', 'bridge.describe("foo")',
+                                   blocking=False)
+
+        # the harness failure raises a JavaScriptError on the loop thread
+        self.peer.sendall('{"exception": {"message": "harness failure"}}')
+
+        start = time.time()
+        self.assertRaises(jsbridge.ConnectionError, response.result)
+        self.assertTrue(time.time() - start < 10)
+        self.assertFalse(self.bridge.connected)
+
+
+class TestCreateNetworkErrors(unittest.TestCase):
+    """Test that a failed connection attempt doesn't leave channels behind"""
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_bridge_failure(self):
+        register = Bridge.register
+
+        def failing_register(bridge):
+            # only the registration of the bridge fails, not the back channel
+            if bridge.bridge_type == 'bridge':
+                raise jsbridge.ConnectionError('registration failed')
+            register(bridge)
+
+        self.addCleanup(setattr, Bridge, 'register', register)
+        Bridge.register = failing_register
+
+        loop = EventLoop()
+        self.assertRaises(jsbridge.ConnectionError, network.create_network,
+                          '127.0.0.1', self.server.getsockname()[1], loop)
+        self.assertEqual(loop.channels, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
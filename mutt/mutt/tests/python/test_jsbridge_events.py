@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+from threading import Event
+import unittest
+
+from jsbridge.network import BackChannel, socketpair
+
+
+class Listener(object):
+
+    def __init__(self, accepted):
+        self.accepted = accepted
+        self.events = []
+        self.received = Event()
+
+    def __call__(self, eventType, result):
+        self.events.append((eventType, result))
+        self.received.set()
+
+    def accepts(self, eventType):
+        return eventType in self.accepted
+
+
+class TestEventHeaders(unittest.TestCase):
+    """Test that events no listener accepts don't get decoded"""
+
+    def setUp(self):
+        sock, self.peer = socketpair()
+        self.back_channel = BackChannel('127.0.0.1', 0, sock=sock)
+
+        request = ''
+        while not request.endswith('\r\n'):
+            request += self.peer.recv(1024)
+        self.assertIn('"nul-event"', request)
+
+        registered = Event()
+        self.back_channel.add_listener(lambda result: registered.set(),
+                                       eventType='register')
+        self.peer.sendall('{"result": true, "eventType": "register", '
+                          '"uuid": "uuid", "framing": "nul-event"}\0')
+        self.assertTrue(registered.wait(10))
+
+    def tearDown(self):
+        self.back_channel.close()
+        self.peer.close()
+
+    def test_skip_events(self):
+        listener = Listener(['mozmill.fail'])
+        self.back_channel.add_global_listener(listener)
+
+        # the skipped event would close the channel if it got decoded
+        self.peer.sendall('@mozmill.pass\n{"invalid"}\0'
+                          '@mozmill.fail\n{"eventType": "mozmill.fail", '
+                          '"result": "failure"}\0')
+
+        self.assertTrue(listener.received.wait(10))
+        self.assertEqual(listener.events, [('mozmill.fail', 'failure')])
+        self.assertTrue(self.back_channel.connected)
+
+    def test_event_listener(self):
+        listener = Listener([])
+        self.back_channel.add_global_listener(listener)
+
+        results = []
+        self.back_channel.add_listener(results.append,
+                                       eventType='mozmill.pass')
+        self.peer.sendall('@mozmill.pass\n{"eventType": "mozmill.pass", '
+                          '"result": "pass"}\0')
+
+        # wanted by the event listener, so the global listener gets it too
+        self.assertTrue(listener.received.wait(10))
+        self.assertEqual(results, ['pass'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+
+import jsbridge
+import mozmill
+
+
+class TestJSObjectCache(unittest.TestCase):
+    """Test the description cache of JSObject"""
+
+    def setUp(self):
+        self.mozmill = mozmill.MozMill.create()
+        self.mozmill.start_runner()
+        self.bridge = self.mozmill.bridge
+
+    def tearDown(self):
+        self.mozmill.stop_runner()
+        self.mozmill.stop()
+        self.mozmill.finish()
+
+    def test_cached_attributes(self):
+        frame = jsbridge.JSObject(self.bridge, mozmill.js_module_frame,
+                                  cache=True)
+        frame.persisted = {'foo': {'bar': 'baz'}}
+
+        events = frame.events
+        self.assertIs(frame.events, events)
+
+        generation = self.bridge.generation
+        self.assertEqual(frame.persisted.foo.bar, 'baz')
+        self.assertIs(frame.events, events)
+
+        # calling a function invalidates the cache
+        frame.persisted.hasOwnProperty('foo')
+        self.assertNotEqual(self.bridge.generation, generation)
+        self.assertIsNot(frame.events, events)
+
+    def test_uncached_attributes(self):
+        frame = jsbridge.JSObject(self.bridge, mozmill.js_module_frame)
+        self.assertIsNot(frame.events, frame.events)
+
+
+if __name__ == '__main__':
+    unittest.main()
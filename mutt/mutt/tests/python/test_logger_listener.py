@@ -4,6 +4,7 @@
 
 from cStringIO import StringIO
 import os
+import tempfile
 import unittest
 
 import mozmill
@@ -41,5 +42,70 @@ class ModuleTest(unittest.TestCase):
         testpath = os.path.join("js-modules", "newEmptyFunction.js")
         self.do_test(testpath)
 
+
+class EventMessageTest(unittest.TestCase):
+
+    def test_filtered_events(self):
+        data = StringIO()
+        logger = LoggerListener(console_level="INFO", console_stream=data)
+
+        class Unserializable(object):
+            pass
+
+        # passes are not logged at INFO level, so they are never serialized
+        logger('mozmill.pass', {'function': Unserializable()})
+        self.assertEqual(data.getvalue(), '')
+
+    def test_accepts(self):
+        logger = LoggerListener(console_level="INFO",
+                                console_stream=StringIO())
+        self.assertTrue(logger.accepts('mozmill.fail'))
+        self.assertFalse(logger.accepts('mozmill.pass'))
+
+    def test_stack(self):
+        info_data = StringIO()
+        debug_data = StringIO()
+        logger = LoggerListener(console_level="INFO", console_stream=info_data,
+                                format="json")
+        logger_debug = LoggerListener(console_level="DEBUG",
+                                      console_stream=debug_data, format="json")
+
+        obj = {'exception': {'message': 'failed', 'stack': 'test@file:1'}}
+        logger('mozmill.fail', obj)
+        logger_debug('mozmill.fail', obj)
+
+        self.assertIn('failed', info_data.getvalue())
+        self.assertNotIn('test@file:1', info_data.getvalue())
+        self.assertIn('test@file:1', debug_data.getvalue())
+        self.assertEqual(obj['exception']['stack'], 'test@file:1')
+
+
+class LogFileTest(unittest.TestCase):
+
+    def test_log_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+
+        logger = LoggerListener(console_level="INFO",
+                                console_stream=StringIO(), log_file=path,
+                                file_level="DEBUG", format="json")
+        for i in range(1000):
+            logger('mozmill.pass', {'function': 'test%d' % i})
+
+        class Results(object):
+            passes = fails = skipped = []
+
+        # stop() returns once all records have been written
+        logger.stop(Results(), False)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        logger.file_handler.close()
+        os.remove(path)
+
+        self.assertEqual(len(lines), 1003)
+        self.assertIn('test999', lines[999])
+        self.assertEqual(logger.file_handler.dropped, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+import unittest
+
+from mozmill import pool
+from mozmill.errors import PoolError
+
+
+class FakeApplication(pool.PooledApplication):
+    """Application which only records the calls of the pool"""
+
+    def __init__(self, jsbridge_port):
+        pool.PooledApplication.__init__(self, None, jsbridge_port)
+        self.calls = []
+        self.preferences = {}
+
+    def info(self):
+        return {'binary': 'firefox', 'jsbridge_port': self.jsbridge_port}
+
+    def start(self):
+        self.calls.append('start')
+
+    def recycle(self):
+        self.calls.append('recycle')
+
+    def is_running(self):
+        return True
+
+    def set_preferences(self, preferences):
+        self.preferences.update(preferences)
+
+    def close(self):
+        self.calls.append('close')
+
+
+class TestPool(unittest.TestCase):
+    """Test leasing applications from the pool daemon"""
+
+    def setUp(self):
+        self.applications = []
+
+        def create_application():
+            application = FakeApplication(10000 + len(self.applications))
+            self.applications.append(application)
+            return application
+
+        self.pool = pool.BrowserPool(create_application, size=1)
+        self.pool.start()
+
+        self.server = pool.PoolServer(('127.0.0.1', 0), self.pool)
+        self.address = self.server.server_address
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.pool.close()
+
+    def test_lease(self):
+        runner = pool.PooledRunner(self.address, timeout=5)
+        self.assertEqual(runner.jsbridge_port, 10000)
+        self.assertEqual(runner.binary, 'firefox')
+        self.assertTrue(runner.is_running())
+
+        runner.profile.set_persistent_preferences({'foo': 'bar'})
+        self.assertEqual(self.applications[0].preferences, {'foo': 'bar'})
+
+        # only a single application is available
+        self.assertRaises(PoolError, pool.PooledRunner, self.address,
+                          timeout=.5)
+
+        runner.cleanup()
+        runner = pool.PooledRunner(self.address, timeout=5)
+        self.assertEqual(runner.jsbridge_port, 10000)
+        self.assertEqual(self.applications[0].calls, ['start', 'recycle'])
+        runner.cleanup()
+
+    def test_parse_address(self):
+        self.assertEqual(pool.parse_address('2000'), ('127.0.0.1', 2000))
+        self.assertEqual(pool.parse_address('localhost:2000'),
+                         ('localhost', 2000))
+        self.assertRaises(PoolError, pool.parse_address, 'localhost')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozprofile import FirefoxProfile
+
+import mozmill
+from mozmill.profiles import ClonedProfile, ProfileCache
+
+
+class TestProfileCache(unittest.TestCase):
+    """Test creating profiles from cached templates"""
+
+    def setUp(self):
+        self.cache = ProfileCache(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.cache.directory)
+
+    def create_profile(self, port):
+        return self.cache.create_profile(
+            FirefoxProfile, addons=mozmill.ADDONS,
+            preferences={'extensions.jsbridge.port': port})
+
+    def read_prefs(self, profile):
+        with open(os.path.join(profile.profile, 'user.js')) as f:
+            return f.read()
+
+    def test_template(self):
+        profile = self.create_profile(2000)
+        other_profile = self.create_profile(3000)
+
+        self.assertTrue(isinstance(profile, ClonedProfile))
+        self.assertTrue(isinstance(profile, FirefoxProfile))
+        self.assertNotEqual(profile.profile, other_profile.profile)
+        self.assertEqual(os.listdir(self.cache.directory),
+                         [os.path.basename(profile.template)])
+
+        extensions = os.path.join(profile.profile, 'extensions', 'staged')
+        self.assertEqual(sorted(os.listdir(extensions)),
+                         ['jsbridge@mozilla.com', 'mozmill@mozilla.com'])
+        self.assertIn('2000', self.read_prefs(profile))
+        self.assertIn('3000', self.read_prefs(other_profile))
+
+        path = profile.profile
+        profile.cleanup()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(profile.template))
+
+    def test_reset(self):
+        profile = self.create_profile(2000)
+        profile.set_persistent_preferences({'mozmill.persistent': True})
+
+        marker = os.path.join(profile.profile, 'marker')
+        open(marker, 'w').close()
+
+        profile.reset()
+        self.assertFalse(os.path.exists(marker))
+        self.assertIn('mozmill.persistent', self.read_prefs(profile))
+        self.assertIn('2000', self.read_prefs(profile))
+
+    def test_clone_tree(self):
+        profile = self.create_profile(2000)
+        with open(os.path.join(profile.template, 'prefs.js'), 'w') as f:
+            f.write('user_pref("mozmill.template", true);\n')
+
+        clone = self.create_profile(3000)
+        template_prefs = os.path.join(clone.template, 'prefs.js')
+        clone_prefs = os.path.join(clone.profile, 'prefs.js')
+        self.assertFalse(os.path.samefile(template_prefs, clone_prefs))
+
+        # modifying the clone leaves the template untouched
+        with open(clone_prefs, 'a') as f:
+            f.write('user_pref("mozmill.clone", true);\n')
+        with open(template_prefs) as f:
+            self.assertNotIn('mozmill.clone', f.read())
+
+    def test_not_cacheable(self):
+        path = tempfile.mkdtemp()
+        try:
+            profile = self.cache.create_profile(FirefoxProfile, profile=path)
+            self.assertFalse(isinstance(profile, ClonedProfile))
+            self.assertEqual(os.listdir(self.cache.directory), [])
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import BaseHTTPServer
+from datetime import datetime
+import glob
+import gzip
+import json
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import threading
+import unittest
+
+from mozmill.report import Report, iterencode
+
+
+class CouchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stands in for CouchDB, and stores the received documents."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+
+        if self.server.fail:
+            self.send_response(self.server.fail)
+            self.end_headers()
+            return
+
+        self.server.documents.append(json.loads(body))
+        self.send_response(201)
+        self.end_headers()
+        self.wfile.write(json.dumps({'ok': True,
+                                     'id': str(len(self.server.documents))}))
+
+    def log_message(self, *args):
+        pass
+
+
+class Results(object):
+
+    def __init__(self, tests):
+        self.mozmill_version = '2.1'
+        self.starttime = self.endtime = datetime.utcnow()
+        self.alltests = self.passes = [{'name': name} for name in tests]
+        self.fails = []
+        self.skipped = []
+        self.screenshots = []
+        self.appinfo = {}
+
+
+class TestReportUpload(unittest.TestCase):
+    """Test uploading compressed reports, and retrying failed uploads"""
+
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                CouchHandler)
+        self.server.documents = []
+        self.server.fail = None
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.url = 'http://127.0.0.1:%d/db/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.spool)
+
+    def spooled(self, report):
+        return glob.glob(os.path.join(report.spool_directory(self.url),
+                                      '*.json.gz'))
+
+    def test_upload(self):
+        report = Report(self.url, report_spool=self.spool)
+        data = report.stop(Results(['test_a', 'test_b']))
+
+        self.assertEqual(data['id'], '1')
+        self.assertEqual(len(self.server.documents), 1)
+        self.assertEqual([test['name'] for test
+                          in self.server.documents[0]['results']],
+                         ['test_a', 'test_b'])
+        self.assertEqual(self.spooled(report), [])
+
+    def test_retry(self):
+        report = Report(self.url, report_spool=self.spool)
+
+        self.server.fail = 503
+        self.assertEqual(report.stop(Results(['test_a'])), None)
+        self.assertEqual(len(self.spooled(report)), 1)
+
+        # the failed report gets uploaded with the next one
+        self.server.fail = None
+        data = report.stop(Results(['test_b']))
+        self.assertEqual(data['id'], '2')
+        self.assertEqual([document['results'][0]['name']
+                          for document in self.server.documents],
+                         ['test_a', 'test_b'])
+        self.assertEqual(self.spooled(report), [])
+
+    def test_rejected(self):
+        report = Report(self.url, report_spool=self.spool)
+
+        # not authorized yet, so the report is kept
+        self.server.fail = 403
+        report.stop(Results(['test_a']))
+        self.assertEqual(len(self.spooled(report)), 1)
+
+        # invalid reports are dropped
+        self.server.fail = 400
+        report.stop(Results(['test_b']))
+        self.assertEqual(self.spooled(report), [])
+
+    def test_iterencode(self):
+        obj = {'results': (test for test in [{'a': 1}, {'b': [2]}]),
+               'name': u'\xe9'}
+        self.assertEqual(json.loads(''.join(iterencode(obj))),
+                         {'results': [{'a': 1}, {'b': [2]}],
+                          'name': u'\xe9'})
+
+
+if __name__ == '__main__':
+    unittest.main()
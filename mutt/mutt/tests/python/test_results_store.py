@@ -0,0 +1,79 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import unittest
+
+from mozmill import TestResults
+from mozmill.results import TestRecord
+
+
+class FakeMozMill(object):
+    running_test = {}
+
+
+class TestResultsStore(unittest.TestCase):
+    """Test the compact storage of test results"""
+
+    def create_results(self, **kwargs):
+        results = TestResults(**kwargs)
+        results.mozmill = FakeMozMill()
+        return results
+
+    def create_test(self, failed=0):
+        return {'filename': 'test_store.js',
+                'name': 'testStore',
+                'passed': 2,
+                'failed': failed,
+                'passes': [{'function': 'assert.ok'}] * 2,
+                'fails': [{'fail': {'message': 'failed'}}] * failed,
+                'time_start': '2012-01-01T00:00:00Z',
+                'time_end': '2012-01-01T00:00:01Z'}
+
+    def test_record(self):
+        test = self.create_test()
+        test['skipped'] = False
+        record = TestRecord(test)
+
+        self.assertEqual(record.to_dict(), test)
+        self.assertEqual(record['name'], 'testStore')
+        self.assertFalse(record.get('skipped', True))
+        self.assertEqual(record.get('meta'), None)
+        self.assertRaises(KeyError, lambda: record['meta'])
+
+    def test_spill(self):
+        results = self.create_results(spill=True)
+        results.endTest_listener(self.create_test())
+        results.endTest_listener(self.create_test(failed=1))
+
+        self.assertEqual(len(results.passes), 1)
+        self.assertEqual(len(results.fails), 1)
+        self.assertTrue(isinstance(results.fails[0].details, (int, long)))
+        self.assertEqual(results.fails[0]['fails'][0]['fail']['message'],
+                         'failed')
+        self.assertEqual(json.loads(json.dumps(dict(results.passes[0]))),
+                         self.create_test())
+
+    def test_close(self):
+        results = self.create_results(spill=True)
+        results.endTest_listener(self.create_test())
+
+        results.close()
+        self.assertTrue(results.store.file.closed)
+        self.assertEqual(results.passes[0]['name'], 'testStore')
+
+        # results without a store can be closed as well
+        self.create_results().close()
+
+    def test_drop_pass_details(self):
+        results = self.create_results(keep_passes=False)
+        results.endTest_listener(self.create_test(failed=1))
+
+        self.assertEqual(results.fails[0]['passed'], 2)
+        self.assertEqual(results.fails[0]['passes'], [])
+        self.assertEqual(len(results.fails[0]['fails']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
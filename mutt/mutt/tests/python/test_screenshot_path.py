@@ -44,10 +44,11 @@ class ScreenshotPathTest(unittest.TestCase):
         self.assertEqual(len(results.screenshots), 1)
         self.assertTrue(os.path.isfile(screenshot))
 
-        wanted_screenshot = os.path.join(self.screenshots_path,
-                                         '%s.jpg' % self.screenshot_name)
+        # screenshots are named by the hash of their content
+        wanted_screenshot = os.path.join(self.screenshots_path, '%s.jpg' %
+                                         results.screenshots[0]['hash'])
         self.assertEqual(wanted_screenshot, screenshot)
-        self.assertTrue(os.path.isfile(screenshot))
+        self.assertEqual(results.screenshots[0]['name'], self.screenshot_name)
 
     def test_screenshot_without_custom_path(self):
         results = self.do_test(persisted=self.persisted)
@@ -59,9 +60,40 @@ class ScreenshotPathTest(unittest.TestCase):
         self.screenshots_path = os.path.dirname(screenshot)
         self.assertIn(tempfile.gettempdir(), screenshot)
 
+    def test_screenshot_duplicates(self):
+        self.screenshots_path = tempfile.mkdtemp()
+        self.persisted['screenshotCount'] = 3
+        results = self.do_test(self.screenshots_path, self.persisted)
+
+        # identical screenshots are stored and reported once
+        self.assertEqual(len(results.screenshots), 1)
+        self.assertEqual(len(results.screenshots[0]['duplicates']), 2)
+        filename = os.path.basename(results.screenshots[0]['filename'])
+        self.assertEqual(os.listdir(self.screenshots_path), [filename])
+
     def tearDown(self):
         mozfile.remove(self.screenshots_path)
 
 
+class ScreenshotResultsTest(unittest.TestCase):
+
+    def test_duplicates(self):
+        results = mozmill.TestResults()
+        results.add_screenshot({'name': 'a', 'hash': '1', 'filename': '1.jpg'})
+        results.add_screenshot({'name': 'b', 'hash': '2', 'filename': '2.jpg'})
+        results.add_screenshot({'name': 'c', 'hash': '1', 'filename': '1.jpg'})
+
+        other = mozmill.TestResults()
+        other.add_screenshot({'name': 'd', 'hash': '2', 'filename': '2.jpg'})
+        other.add_screenshot({'name': 'e', 'hash': '2', 'filename': '2.jpg'})
+        results.merge(other)
+
+        self.assertEqual([screenshot['name']
+                          for screenshot in results.screenshots], ['a', 'b'])
+        self.assertEqual(results.screenshots[0]['duplicates'], [{'name': 'c'}])
+        self.assertEqual(results.screenshots[1]['duplicates'],
+                         [{'name': 'd'}, {'name': 'e'}])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+from cStringIO import StringIO
+import sys
+import unittest
+
+from jsbridge.network import BackChannel, Bridge, socketpair
+import mozmill
+
+
+class FakeProfile(object):
+
+    def set_persistent_preferences(self, preferences):
+        pass
+
+
+class FakeRunner(object):
+    """Stands in for an application which has already exited."""
+
+    profile = FakeProfile()
+
+    def wait(self, timeout=None):
+        pass
+
+    def is_running(self):
+        return False
+
+
+class TestStopRunner(unittest.TestCase):
+    """Test stopping an application without a connected bridge"""
+
+    def setUp(self):
+        self.mozmill = mozmill.MozMill(FakeRunner(), 0)
+
+    def tearDown(self):
+        self.mozmill.http_server_stop()
+
+    def test_no_network(self):
+        self.assertEqual(self.mozmill.back_channel, None)
+        self.mozmill.stop_runner()
+
+    def test_disconnected(self):
+        sockets = socketpair() + socketpair()
+        self.mozmill.back_channel = BackChannel('127.0.0.1', 0,
+                                                sock=sockets[0])
+        self.mozmill.bridge = Bridge('127.0.0.1', 0, sock=sockets[2])
+        self.mozmill.back_channel.close()
+        self.mozmill.bridge.close()
+
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.mozmill.stop_runner()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            for sock in sockets:
+                sock.close()
+
+        # nothing has been sent over the closed connection
+        self.assertEqual(output, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, you can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import tempfile
+import unittest
+
+import mozmill
+from mozmill.report import StreamReport
+
+
+class TestStreamReport(unittest.TestCase):
+    """Test streaming of results as JSON lines"""
+
+    def test_stream_report(self):
+        abspath = os.path.dirname(os.path.abspath(__file__))
+        testpath = os.path.join(abspath, "js-modules", "newEmptyFunction.js")
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+
+        try:
+            report = StreamReport('file://%s' % path)
+
+            m = mozmill.MozMill.create(handlers=[report])
+            m.run([{'path': testpath}])
+            m.finish()
+
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        finally:
+            os.remove(path)
+
+        self.assertEqual([record['event'] for record in records],
+                         ['mozmill.endTest', 'mozmill.endModule', 'summary'])
+        self.assertEqual(records[0]['test']['name'], 'test_something')
+        self.assertEqual(records[1]['module']['filename'], testpath)
+        self.assertEqual(records[2]['tests_passed'], 1)
+        self.assertEqual(records[2]['tests_failed'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()